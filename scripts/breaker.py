@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Circuit breakers in front of the OpenAI chat and embedding calls.
+
+When OpenAI is down or throttling, every call used to wait for its 30-60 s
+timeout before the classifier fell back to its rules: hours for a 10k-post
+run. A breaker counts consecutive failures (exceptions, HTTP 429 / 5xx, and
+calls slower than BREAKER_SLOW_SECONDS); after BREAKER_FAILURES of them it
+opens and calls fail at once with CircuitOpen, which the classifiers already
+treat as "use the rules". After BREAKER_OPEN_SECONDS one probe call is let
+through: success closes the breaker, failure reopens it for twice as long
+(up to BREAKER_MAX_OPEN_SECONDS).
+
+    response = breaker.get("openai_chat").call(lambda: session.post(url, json=data, timeout=30))
+
+llm_cache.post() goes through "openai_chat" (cache hits never touch it),
+classify_posts_batch.request_embeddings through "openai_embeddings".
+"""
+
+import os
+import threading
+import time
+
+import metrics
+
+FAILURES = int(os.getenv("BREAKER_FAILURES", "3"))
+SLOW_SECONDS = float(os.getenv("BREAKER_SLOW_SECONDS", "20"))
+OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+MAX_OPEN_SECONDS = float(os.getenv("BREAKER_MAX_OPEN_SECONDS", "600"))
+
+# Statuses that say the service (not the request) is in trouble
+FAILURE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a service whose breaker is open."""
+
+
+class CircuitBreaker:
+    """closed -> open after `failures` consecutive failures -> one probe after `open_seconds` -> closed / open."""
+
+    def __init__(self, name, failures=FAILURES, slow_seconds=SLOW_SECONDS,
+                 open_seconds=OPEN_SECONDS, max_open_seconds=MAX_OPEN_SECONDS):
+        self.name = name
+        self.failures = failures
+        self.slow_seconds = slow_seconds
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.lock = threading.Lock()
+        self.state = "closed"
+        self.consecutive = 0
+        self.open_for = open_seconds
+        self.retry_at = 0.0
+        self.probing = False
+
+    @property
+    def is_open(self):
+        return self.state != "closed"
+
+    def allow(self):
+        """True when a call may go out (closed, or the single probe of an open breaker)."""
+        with self.lock:
+            if self.state == "closed":
+                return True
+            if self.probing or time.monotonic() < self.retry_at:
+                return False
+            self.probing = True
+            metrics.incr(f"breaker_probes.{self.name}")
+            return True
+
+    def record(self, ok):
+        with self.lock:
+            self.probing = False
+            if ok:
+                if self.state != "closed":
+                    print(f"  ✅ {self.name}: back to normal, circuit closed")
+                self.state = "closed"
+                self.consecutive = 0
+                self.open_for = self.open_seconds
+                return
+            self.consecutive += 1
+            if self.state == "open":
+                # Failed probe: stay open, longer
+                self.open_for = min(self.open_for * 2, self.max_open_seconds)
+            elif self.consecutive < self.failures:
+                return
+            self.state = "open"
+            self.retry_at = time.monotonic() + self.open_for
+            metrics.incr(f"breaker_opened.{self.name}")
+            print(f"  ⚡ {self.name}: {self.consecutive} failures in a row, circuit open for {self.open_for:.0f}s")
+
+    def call(self, send):
+        """send() -> requests.Response through the breaker. Raises CircuitOpen without calling when open."""
+        if not self.allow():
+            metrics.incr(f"breaker_short_circuits.{self.name}")
+            raise CircuitOpen(f"{self.name} circuit open")
+        start = time.monotonic()
+        try:
+            response = send()
+        except Exception:
+            self.record(False)
+            raise
+        elapsed = time.monotonic() - start
+        slow = elapsed > self.slow_seconds
+        if slow:
+            metrics.incr(f"breaker_slow_calls.{self.name}")
+        self.record(response.status_code not in FAILURE_STATUSES and not slow)
+        return response
+
+    def wait(self, stop=None):
+        """Block until a probe may go out (returns at once when closed), or until `stop` is set."""
+        while True:
+            with self.lock:
+                if self.state == "closed" or not self.probing and time.monotonic() >= self.retry_at:
+                    return
+                delay = max(self.retry_at - time.monotonic(), 1.0)
+            if stop is not None:
+                if stop.wait(delay):
+                    return
+            else:
+                time.sleep(delay)
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get(name):
+    """The process-wide breaker for a service name."""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
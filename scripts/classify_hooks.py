@@ -5,11 +5,18 @@ Uses OpenAI API for classification with rule-based fallback.
 """
 
 import os
+import sys
 import json
 import requests
-import time
 import re
 
+import breaker
+import distinct
+import llm_cache
+import metrics
+import profiling
+import tokens
+
 # Supabase config
 SUPABASE_URL = os.getenv("SUPABASE_URL", "https://qzorivymybqavkxexrbf.supabase.co")
 SUPABASE_KEY = os.getenv("SUPABASE_ANON_KEY", "")
@@ -98,14 +105,17 @@ def get_supabase_headers():
     }
 
 
-def fetch_unclassified_hooks(limit=100):
-    """Fetch hooks without hook_type_id."""
+def fetch_unclassified_hooks(limit=100, reclassify=False):
+    """Fetch hooks without hook_type_id (or, with reclassify, those labelled by the rules)."""
     url = f"{SUPABASE_URL}/rest/v1/generated_hooks"
     params = {
         "select": "id,text,production_post_id",
-        "hook_type_id": "is.null",
         "limit": limit
     }
+    if reclassify:
+        params["needs_llm_classification"] = "is.true"
+    else:
+        params["hook_type_id"] = "is.null"
     response = requests.get(url, headers=get_supabase_headers(), params=params)
     return response.json() if response.status_code == 200 else []
 
@@ -120,23 +130,29 @@ def classify_with_openai(hook_text: str) -> dict:
     
     data = {
         "model": "gpt-5.2",
-        "messages": [{"role": "user", "content": CLASSIFICATION_PROMPT.format(hook=hook_text[:300])}],
+        "messages": [{"role": "user", "content": CLASSIFICATION_PROMPT.format(hook=tokens.truncate(hook_text, 100, tokens.CHAT_MODEL))}],
         "temperature": 0.1,
         "max_tokens": 50,
         "response_format": {"type": "json_object"}
     }
     
     try:
-        response = requests.post(url, headers=headers, json=data, timeout=30)
+        response = llm_cache.post(url, headers=headers, json=data, timeout=30)
         if response.status_code == 200:
-            text = response.json()["choices"][0]["message"]["content"]
+            body = response.json()
+            metrics.record_usage(body.get("usage"), data["model"])
+            text = body["choices"][0]["message"]["content"]
             result = json.loads(text)
             hook_type = result.get("hook_type", "bold_claim")
             if hook_type in HOOK_TYPES:
-                return {"hook_type": hook_type, "confidence": result.get("confidence", 0.8)}
+                return {"hook_type": hook_type, "confidence": result.get("confidence", 0.8), "source": "llm"}
+    except breaker.CircuitOpen:
+        # OpenAI is known to be down: rules right away, the hook is tagged for later
+        pass
     except Exception as e:
         print(f"  OpenAI error: {e}")
     
+    metrics.incr("llm_fallbacks")
     return classify_rule_based(hook_text)
 
 
@@ -172,13 +188,13 @@ def classify_rule_based(hook_text: str) -> dict:
     return {"hook_type": best_type, "confidence": confidence}
 
 
-def update_hook_classification(hook_id: str, hook_type: str):
-    """Update hook with classification."""
+def update_hook_classification(hook_id: str, hook_type: str, needs_llm: bool = False):
+    """Update hook with classification (needs_llm tags rule-based labels for --reclassify)."""
     url = f"{SUPABASE_URL}/rest/v1/generated_hooks"
     params = {"id": f"eq.{hook_id}"}
     
     hook_type_id = HOOK_TYPES.get(hook_type, HOOK_TYPES["bold_claim"])["id"]
-    data = {"hook_type_id": hook_type_id}
+    data = {"hook_type_id": hook_type_id, "needs_llm_classification": needs_llm}
     
     response = requests.patch(url, headers=get_supabase_headers(), params=params, json=data)
     return response.status_code in [200, 204]
@@ -189,7 +205,13 @@ def classify_hooks_batch(hooks: list) -> list:
     if not OPENAI_API_KEY or len(hooks) == 0:
         return [classify_rule_based(h["text"]) for h in hooks]
     
-    hooks_text = "\n".join([f'{i+1}. "{h["text"][:150]}"' for i, h in enumerate(hooks[:10])])
+    batch = hooks[:10]
+    # Identical hooks are classified once, empty ones by the rules
+    texts, index = distinct.unique([h["text"] for h in batch])
+    if not texts:
+        return [classify_rule_based(h["text"]) for h in batch]
+    
+    hooks_text = "\n".join([f'{i+1}. "{tokens.truncate(text, 50, tokens.CHAT_MODEL)}"' for i, text in enumerate(texts)])
     
     batch_prompt = f"""Classifie ces hooks viraux. Pour chaque hook, donne le type parmi:
 bold_claim, contrarian, curiosity_gap, direct_address, number, pain_point, question, result, social_proof, story_opener
@@ -212,29 +234,36 @@ Réponds avec un JSON array:
     }
     
     try:
-        response = requests.post(url, headers=headers, json=data, timeout=60)
+        response = llm_cache.post(url, headers=headers, json=data, timeout=60)
         if response.status_code == 200:
-            text = response.json()["choices"][0]["message"]["content"]
+            body = response.json()
+            metrics.record_usage(body.get("usage"), data["model"])
+            text = body["choices"][0]["message"]["content"]
             result = json.loads(text)
             classifications = result if isinstance(result, list) else result.get("classifications", [])
             
-            # Map results back to hooks
+            # Map results back to the distinct hooks, then to every hook
             results = []
-            for i, hook in enumerate(hooks[:10]):
+            for i, hook_text in enumerate(texts):
                 match = next((c for c in classifications if c.get("index") == i + 1), None)
                 if match and match.get("hook_type") in HOOK_TYPES:
-                    results.append({"hook_type": match["hook_type"], "confidence": 0.85})
+                    results.append({"hook_type": match["hook_type"], "confidence": 0.85, "source": "llm"})
                 else:
-                    results.append(classify_rule_based(hook["text"]))
-            return results
+                    results.append(classify_rule_based(hook_text))
+            return [r if r is not None else classify_rule_based(h["text"])
+                    for h, r in zip(batch, distinct.fan_out(results, index))]
+    except breaker.CircuitOpen:
+        pass
     except Exception as e:
         print(f"  Batch classification error: {e}")
     
-    return [classify_rule_based(h["text"]) for h in hooks[:10]]
+    metrics.incr("llm_fallbacks")
+    return [classify_rule_based(h["text"]) for h in batch]
 
 
 def main():
     print("🎣 Starting hook classification with GPT-5.2...")
+    metrics.start_run("classify_hooks")
     
     if not SUPABASE_KEY:
         print("❌ Missing SUPABASE_ANON_KEY environment variable")
@@ -242,37 +271,65 @@ def main():
     
     # Fetch hook types from database
     print("📚 Fetching hook types from database...")
-    fetch_hook_types()
+    with metrics.stage("load_labels"):
+        fetch_hook_types()
     print(f"   Found {len(HOOK_TYPES)} hook types")
     
+    # --reclassify: redo the hooks labelled by the rules while OpenAI was unavailable
+    reclassify = "--reclassify" in sys.argv
+    if reclassify and not OPENAI_API_KEY:
+        # Without a key every row would get the same rule-based labels again
+        raise ValueError("OPENAI_API_KEY environment variable is required for --reclassify")
+    chat = breaker.get("openai_chat")
+    
     total_classified = 0
     batch_num = 0
+    # Hooks the LLM failed on again during this run (--reclassify)
+    left = set()
     
     while True:
         batch_num += 1
-        hooks = fetch_unclassified_hooks(limit=50)
+        if reclassify and chat.is_open:
+            # Reclassifying with the rules again would only re-tag the rows
+            print("⏸️ OpenAI unavailable, waiting for the circuit to close...")
+            chat.wait()
+        with metrics.stage("fetch"):
+            hooks = fetch_unclassified_hooks(limit=50, reclassify=reclassify)
         
         if not hooks:
             print("✅ All hooks classified!")
             break
+        if all(hook["id"] in left for hook in hooks):
+            print(f"⚠️ {len(left)} hooks still rule-based, left for the next --reclassify run")
+            break
         
         print(f"\n📦 Batch {batch_num}: {len(hooks)} hooks")
+        metrics.incr("items_found", len(hooks))
         
         # Process in batches of 10 for API efficiency
         for i in range(0, len(hooks), 10):
             batch = hooks[i:i+10]
             
-            if OPENAI_API_KEY:
-                classifications = classify_hooks_batch(batch)
-            else:
-                classifications = [classify_rule_based(h["text"]) for h in batch]
-            
-            for j, (hook, classification) in enumerate(zip(batch, classifications)):
-                if update_hook_classification(hook["id"], classification["hook_type"]):
-                    total_classified += 1
+            with metrics.stage("classify"):
+                if OPENAI_API_KEY:
+                    classifications = classify_hooks_batch(batch)
+                else:
+                    classifications = [classify_rule_based(h["text"]) for h in batch]
             
-            if OPENAI_API_KEY:
-                time.sleep(0.2)  # Rate limit
+            with metrics.stage("write"):
+                for j, (hook, classification) in enumerate(zip(batch, classifications)):
+                    # Rules standing in for the LLM: tagged for a --reclassify pass
+                    needs_llm = bool((hook["text"] or "").strip()) and classification.get("source") != "llm"
+                    if reclassify and needs_llm:
+                        # Still rule-based: the row keeps its tag instead of the same labels
+                        left.add(hook["id"])
+                        metrics.incr("items_failed")
+                        continue
+                    if update_hook_classification(hook["id"], classification["hook_type"], needs_llm):
+                        total_classified += 1
+                        metrics.incr("items_processed")
+                    else:
+                        metrics.incr("items_failed")
             
             print(f"  Classified {min(i + 10, len(hooks))}/{len(hooks)}...")
         
@@ -282,4 +339,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    profiling.run(main)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Single entry point for the scripts.
+
+    python cli.py <command> [args...]
+    python cli.py <command> --help      # the script's docstring
+    python cli.py bench-startup         # startup time of --help and of each command's imports
+
+Each command runs an existing script's main() with its own arguments, so
+`python cli.py classify topic --chunked` is `python classify_posts_batch.py
+topic --chunked`. Only the standard library is imported up front: the
+script, and with it numpy / requests / openai, is imported once the command
+is known, and --help reads docstrings without importing anything. Cron jobs
+and --help return in milliseconds.
+"""
+
+import ast
+import importlib
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+
+# command: (module, summary); with a dict {argument: (module, leading args)} the first argument picks the script
+COMMANDS = {
+    "scrape": ("scrape_missing_profiles", "Scrape posts for the profiles that have none yet"),
+    "ingest": ("bulk_insert_posts", "Scrape the known authors and bulk insert their posts"),
+    "embed-refs": ({
+        "topics": ("generate_embeddings", []),
+        "hooks": ("generate_hook_embeddings", []),
+        "structures": ("generate_structure_audience_embeddings", []),
+    }, "Embed the reference labels: topics | hooks | structures (structures + audiences)"),
+    "classify": ({
+        "topic": ("classify_posts_batch", ["topic"]),
+        "hook": ("classify_posts_batch", ["hook"]),
+        "structure": ("classify_posts_batch", ["structure"]),
+        "audience": ("classify_posts_batch", ["audience"]),
+        "llm": ("classify_posts", []),
+    }, "Classify posts: topic | hook | structure | audience by embeddings, llm with GPT + rules"),
+    "classify-hooks": ("classify_hooks", "Classify generated hooks by hook type"),
+    "analyze-topics": ("analyze_topics", "Recurring themes of the viral posts"),
+    "analyze-styles": ("analyze_writing_styles", "Writing style analysis of every author"),
+    "seed": ("seeder", "Seed viral_posts_bank (Unipile)"),
+    "worker": ("worker", "Resident worker draining the needs_* flags"),
+    "discover-topics": ("topic_discovery", "Mini-batch k-means topic discovery"),
+    "snapshot": ("snapshot", "Local columnar snapshot: export | sync | compact | info"),
+    "dedupe": ("dedupe", "Near-duplicate detection: index | mark | report"),
+    "engagement": ("engagement", "Per-author engagement ranking: build | top"),
+    "journal": ("journal", "Write-behind journal: status | replay"),
+    "llm-cache": ("llm_cache", "LLM response cache: stats | prune | clear"),
+    "rest": ("supabase_rest", "Shared PostgREST client: bench (HTTP/1.1 pool vs HTTP/2)"),
+    "ratelimit": ("ratelimit", "Shared OpenAI / RapidAPI rate limits: status | reset | simulate"),
+    "pg-bulk": ("pg_bulk", "Direct Postgres COPY path: check"),
+    "quantize": ("quantize", "Quantized embeddings report"),
+    "dimensions": ("dimensions", "Reduced-dimension embeddings report"),
+}
+
+
+def usage():
+    width = max(map(len, COMMANDS))
+    lines = ["usage: python cli.py <command> [args...]   (<command> --help for details)", ""]
+    lines += [f"  {name.ljust(width)}  {summary}" for name, (_, summary) in COMMANDS.items()]
+    lines += ["", f"  {'bench-startup'.ljust(width)}  Measure startup time (--runs=N)"]
+    return "\n".join(lines)
+
+
+def resolve(command, args):
+    """(module, script arguments) for a command line, or (None, args) when the variant is missing."""
+    target = COMMANDS[command][0]
+    if isinstance(target, str):
+        return target, args
+    if not args or args[0] not in target:
+        return None, args
+    module, leading = target[args[0]]
+    return module, leading + args[1:]
+
+
+def module_docstring(module):
+    """A script's docstring, read without importing it."""
+    source = (SCRIPTS_DIR / f"{module}.py").read_text(encoding="utf-8")
+    return ast.get_docstring(ast.parse(source)) or ""
+
+
+def run(command, args):
+    module_name, args = resolve(command, args)
+    if module_name is None:
+        choices = " | ".join(COMMANDS[command][0])
+        print(f"❌ {command} needs one of: {choices}")
+        return 2
+    if "--help" in args or "-h" in args:
+        print(module_docstring(module_name).strip())
+        return 0
+    # The scripts read their options from sys.argv, some at import time
+    sys.argv = [str(SCRIPTS_DIR / f"{module_name}.py"), *args]
+    module = importlib.import_module(module_name)
+    import profiling
+    profiling.run(module.main, name=module_name)
+    return 0
+
+
+def _wall_ms(argv, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(argv, cwd=SCRIPTS_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), result.returncode
+
+
+def bench_startup(runs=5):
+    """Median wall time of the interpreter alone, `cli.py --help` and each command's imports."""
+    python = sys.executable
+    baseline, _ = _wall_ms([python, "-c", "pass"], runs)
+    print(f"⏱️ Startup, median of {runs} runs (python alone: {baseline:.0f} ms)\n")
+    rows = [("cli.py --help", [python, str(SCRIPTS_DIR / "cli.py"), "--help"])]
+    modules = []
+    for target, _ in COMMANDS.values():
+        for module in ([target] if isinstance(target, str) else [m for m, _ in target.values()]):
+            if module not in modules:
+                modules.append(module)
+    rows += [(f"import {m}", [python, "-c", f"import {m}"]) for m in modules]
+    for label, argv in rows:
+        ms, code = _wall_ms(argv, runs)
+        note = "" if code == 0 else f"  (exit {code})"
+        print(f"  {label:<52} {ms:7.0f} ms  (+{ms - baseline:.0f}){note}")
+
+
+def main():
+    args = sys.argv[1:]
+    if not args or args[0] in ("-h", "--help", "help"):
+        print(usage())
+        return 0
+    command, rest = args[0], args[1:]
+    if command == "bench-startup":
+        runs = next((int(a.split("=", 1)[1]) for a in rest if a.startswith("--runs=")), 5)
+        bench_startup(runs)
+        return 0
+    if command not in COMMANDS:
+        print(f"❌ Unknown command '{command}'\n")
+        print(usage())
+        return 2
+    return run(command, rest)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
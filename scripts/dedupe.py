@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate detection for viral_posts_bank with MinHash + LSH.
+
+Re-scrapes, reposts and lightly edited copies end up as separate rows, each
+one embedded, classified and counted on its own. Every post (hook + content)
+is cut into word 5-gram shingles and summarized by a 128-value MinHash
+signature; the signature is split into 16 bands of 8 rows and each band is
+hashed into a bucket. Posts sharing a bucket are candidates, kept when their
+estimated Jaccard similarity reaches DEDUPE_THRESHOLD (0.8). Only bucket
+neighbours are compared, so indexing is roughly linear in the corpus size.
+
+The index lives in scripts/cache/dedupe.sqlite and is updated incrementally:
+`index` only reads posts created since the last run. Each cluster's canonical
+row is its oldest post; `mark` writes duplicate_of on the copies through
+mark_duplicate_posts (20260207_near_duplicate_posts.sql), which also gives
+them the canonical's embedding / labels and clears their needs_* flags.
+
+    python dedupe.py index [--mark]
+    python dedupe.py mark
+    python dedupe.py report
+"""
+
+import os
+import sys
+import re
+import hashlib
+import sqlite3
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+import llm_cache
+import metrics
+import profiling
+import snapshot
+import supabase_rest
+
+INDEX_PATH = Path(os.getenv("DEDUPE_INDEX_PATH", Path(__file__).parent / "cache" / "dedupe.sqlite"))
+THRESHOLD = float(os.getenv("DEDUPE_THRESHOLD", "0.8"))
+
+SHINGLE_WORDS = 5
+NUM_PERM = 128
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+
+# Universal hashing (a * x + b) mod p on 32-bit shingle hashes; a * x fits in uint64
+PRIME = np.uint64(4294967291)
+_rng = np.random.default_rng(1)
+PERM_A = _rng.integers(1, int(PRIME), NUM_PERM, dtype=np.uint64)
+PERM_B = _rng.integers(0, int(PRIME), NUM_PERM, dtype=np.uint64)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    post_id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    canonical_id TEXT NOT NULL,
+    signature BLOB NOT NULL,
+    marked INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_posts_canonical ON posts(canonical_id);
+CREATE TABLE IF NOT EXISTS bands (
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    post_id TEXT NOT NULL,
+    PRIMARY KEY (band, bucket, post_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+WORD_RE = re.compile(r"\w+")
+
+
+def shingles(text):
+    """32-bit hashes of the word 5-grams of a normalized text (the whole text when shorter)."""
+    words = WORD_RE.findall(llm_cache.normalize(text).lower())
+    if not words:
+        return np.zeros(0, dtype=np.uint64)
+    if len(words) <= SHINGLE_WORDS:
+        grams = {" ".join(words)}
+    else:
+        grams = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+
+
+def minhash(hashes):
+    """NUM_PERM-value MinHash signature (uint32) of a set of shingle hashes."""
+    values = (PERM_A[:, None] * hashes[None, :] + PERM_B[:, None]) % PRIME
+    return values.min(axis=1).astype(np.uint32)
+
+
+def band_buckets(signature):
+    """One signed 64-bit bucket id per band (SQLite INTEGER)."""
+    raw = signature.tobytes()
+    size = ROWS_PER_BAND * 4
+    return [
+        int.from_bytes(hashlib.blake2b(raw[i * size:(i + 1) * size], digest_size=8).digest(), "little", signed=True)
+        for i in range(BANDS)
+    ]
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.mean(a == b))
+
+
+def post_text(post):
+    return f"{post.get('hook') or ''}\n{post.get('content') or ''}"
+
+
+class DedupeIndex:
+    def __init__(self, path=INDEX_PATH):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def get_meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def __contains__(self, post_id):
+        return self.conn.execute("SELECT 1 FROM posts WHERE post_id = ?", (post_id,)).fetchone() is not None
+
+    def candidates(self, buckets):
+        ids = set()
+        for band, bucket in enumerate(buckets):
+            ids.update(r[0] for r in self.conn.execute(
+                "SELECT post_id FROM bands WHERE band = ? AND bucket = ?", (band, bucket)))
+        return ids
+
+    def add(self, post_id, text, created_at):
+        """Index a post. Returns its canonical id, or None when the text has no words."""
+        hashes = shingles(text)
+        if not len(hashes):
+            return None
+        signature = minhash(hashes)
+        buckets = band_buckets(signature)
+
+        # Canonical ids of the clusters this post belongs to
+        matched = {}
+        for candidate in self.candidates(buckets):
+            other, canonical = self.conn.execute(
+                "SELECT signature, canonical_id FROM posts WHERE post_id = ?", (candidate,)).fetchone()
+            if similarity(signature, np.frombuffer(other, dtype=np.uint32)) >= THRESHOLD:
+                matched[canonical] = self.conn.execute(
+                    "SELECT created_at FROM posts WHERE post_id = ?", (canonical,)).fetchone()[0]
+
+        # The oldest post of the merged cluster is canonical
+        matched[post_id] = created_at
+        canonical = min(matched, key=lambda pid: (matched[pid], pid))
+        for loser in matched:
+            if loser not in (canonical, post_id):
+                self.conn.execute("UPDATE posts SET canonical_id = ?, marked = 0 WHERE canonical_id = ?",
+                                  (canonical, loser))
+                metrics.incr("clusters_merged")
+
+        self.conn.execute(
+            "INSERT OR REPLACE INTO posts (post_id, created_at, canonical_id, signature, marked) VALUES (?, ?, ?, ?, 0)",
+            (post_id, created_at, canonical, signature.tobytes()))
+        self.conn.executemany("INSERT OR IGNORE INTO bands (band, bucket, post_id) VALUES (?, ?, ?)",
+                              [(band, bucket, post_id) for band, bucket in enumerate(buckets)])
+        if canonical != post_id:
+            metrics.incr("duplicates_found")
+        return canonical
+
+    def unmarked(self):
+        """{canonical_id: [duplicate ids]} for copies whose duplicate_of is not written yet."""
+        groups = {}
+        for post_id, canonical in self.conn.execute(
+                "SELECT post_id, canonical_id FROM posts WHERE marked = 0 AND post_id <> canonical_id"):
+            groups.setdefault(canonical, []).append(post_id)
+        return groups
+
+    def set_marked(self, post_ids):
+        self.conn.executemany("UPDATE posts SET marked = 1 WHERE post_id = ?", [(pid,) for pid in post_ids])
+        self.conn.commit()
+
+    def clusters(self):
+        """(canonical_id, size) of every cluster with copies, biggest first."""
+        return self.conn.execute(
+            "SELECT canonical_id, COUNT(*) FROM posts GROUP BY canonical_id HAVING COUNT(*) > 1 "
+            "ORDER BY COUNT(*) DESC").fetchall()
+
+
+def index_new_posts(index):
+    """Add posts created since the last run. Returns (indexed, duplicates)."""
+    since = index.get_meta("high_water_mark")
+    indexed = duplicates = 0
+    # Oldest first: once a page is indexed, every row before its last created_at is too,
+    # so an interrupted run resumes from there without skipping anything
+    pages = snapshot.fetch_changed_pages(since, "id,content,hook,created_at", column="created_at")
+    while True:
+        with metrics.stage("fetch"):
+            page = next(pages, None)
+        if page is None:
+            break
+        with metrics.stage("index"):
+            for post in page:
+                if post["id"] in index:
+                    continue
+                canonical = index.add(post["id"], post_text(post), snapshot.parse_timestamp(post.get("created_at")))
+                if canonical is None:
+                    continue
+                indexed += 1
+                duplicates += canonical != post["id"]
+            if page[-1].get("created_at"):
+                index.set_meta("high_water_mark", page[-1]["created_at"])
+            index.conn.commit()
+        print(f"  Indexed {indexed} posts, {duplicates} duplicates...")
+    metrics.incr("items_processed", indexed)
+    return indexed, duplicates
+
+
+def mark_duplicates(index):
+    """Write duplicate_of for copies not marked yet. Returns the number of rows marked."""
+    marked = 0
+    for canonical, copies in index.unmarked().items():
+        with metrics.stage("write"):
+            status, _ = supabase_rest.rpc("mark_duplicate_posts", {"p_canonical": canonical, "p_duplicates": copies})
+        if status == 200:
+            index.set_marked(copies)
+            marked += len(copies)
+        else:
+            metrics.incr("items_failed", len(copies))
+            print(f"  ❌ mark_duplicate_posts failed for {canonical}: HTTP {status}")
+    metrics.incr("duplicates_marked", marked)
+    return marked
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "report"
+    index = DedupeIndex()
+
+    if command in ("index", "mark"):
+        metrics.start_run(f"dedupe:{command}")
+    if command == "index":
+        print(f"🔍 Indexing new posts into {INDEX_PATH} (threshold {THRESHOLD})...")
+        indexed, duplicates = index_new_posts(index)
+        print(f"✅ {indexed} posts indexed, {duplicates} near-duplicates")
+    if command == "mark" or (command == "index" and "--mark" in sys.argv):
+        print(f"🏷️ {mark_duplicates(index)} copies marked (duplicate_of)")
+    if command in ("index", "mark"):
+        return
+
+    total = index.conn.execute("SELECT COUNT(*) FROM posts").fetchone()[0]
+    clusters = index.clusters()
+    copies = sum(size - 1 for _, size in clusters)
+    pending = sum(len(v) for v in index.unmarked().values())
+    print(f"🔍 {INDEX_PATH}")
+    print(f"  {total} posts indexed, {len(clusters)} clusters, {copies} copies ({pending} not marked yet)")
+    for canonical, size in clusters[:20]:
+        print(f"  {canonical}  {size} posts")
+
+
+if __name__ == "__main__":
+    profiling.run(main)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Reduced-dimension embeddings.
+
+text-embedding-3-small accepts a `dimensions` parameter, and its vectors are
+trained so that the first d components (renormalized) are a valid d-dim
+embedding. Posts can therefore be embedded at 256/512/... dims while label
+vectors, stored at 1536 dims in the database (vector(1536) columns), are cut to
+the same size locally: both sides stay in the same space.
+
+Set EMBEDDING_DIMENSIONS (or --dimensions=N in classify_posts_batch.py).
+
+Benchmark (agreement vs 1536 dims, memory, scoring time):
+    python dimensions.py topic --limit 5000
+    python dimensions.py topic --synthetic 20000   # worst case: random vectors
+                                                    # are not front-loaded like real ones
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+import profiling
+import quantize
+
+FULL_DIMENSIONS = 1536
+SUPPORTED_DIMENSIONS = [256, 512, 768, 1024, 1536]
+
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", str(FULL_DIMENSIONS)))
+
+
+def validate(dimensions):
+    if dimensions not in SUPPORTED_DIMENSIONS:
+        raise ValueError(f"Unsupported dimensions {dimensions}, expected one of {SUPPORTED_DIMENSIONS}")
+    return dimensions
+
+
+def reduce(vectors, dimensions):
+    """Keep the first `dimensions` components and renormalize (vector or matrix)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.shape[-1] == dimensions:
+        return vectors
+    if vectors.shape[-1] < dimensions:
+        raise ValueError(f"Cannot expand {vectors.shape[-1]}-dim vectors to {dimensions}")
+    cut = vectors[..., :dimensions]
+    norms = np.linalg.norm(cut, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return cut / norms
+
+
+def api_params(dimensions=None):
+    """Extra embeddings request fields for a dimension mode."""
+    dimensions = dimensions or EMBEDDING_DIMENSIONS
+    return {} if dimensions == FULL_DIMENSIONS else {"dimensions": dimensions}
+
+
+def benchmark(labels, posts):
+    """Classification agreement, memory and scoring time per dimension vs 1536 dims."""
+    labels = quantize.normalize(labels)
+    posts = quantize.normalize(posts)
+    baseline = (posts @ labels.T).argmax(axis=1)
+    n = len(posts)
+
+    print(f"\n📊 {n} posts, {len(labels)} labels")
+    print(f"{'dims':>6} {'bytes/vec':>10} {'json/vec':>9} {'1M posts':>9} {'agreement':>10} {'score time':>11}")
+    for d in SUPPORTED_DIMENSIONS:
+        if d > posts.shape[1]:
+            continue
+        p = reduce(posts, d)
+        l = reduce(labels, d)
+        t0 = time.perf_counter()
+        predicted = (p @ l.T).argmax(axis=1)
+        elapsed = time.perf_counter() - t0
+        agreement = (predicted == baseline).mean() * 100
+        # pgvector/JSON text is ~10 bytes per component ("-0.0123456,")
+        print(f"{d:6} {d * 4:10} {d * 10:9} {d * 4 / 1e3:7.1f}GB {agreement:9.2f}% {elapsed * 1000:9.1f}ms")
+
+
+def main():
+    mode = "topic"
+    if len(sys.argv) > 1 and sys.argv[1] in quantize.LABEL_TABLES:
+        mode = sys.argv[1]
+    limit = 5000
+    synthetic = None
+    for i, arg in enumerate(sys.argv):
+        if arg == "--limit" and i + 1 < len(sys.argv):
+            limit = int(sys.argv[i + 1])
+        elif arg == "--synthetic" and i + 1 < len(sys.argv):
+            synthetic = int(sys.argv[i + 1])
+
+    print(f"📏 Dimension benchmark ({mode})...")
+    if synthetic:
+        labels, posts = quantize.synthetic_data(synthetic)
+    else:
+        _, labels = quantize.fetch_label_matrix(mode)
+        posts = quantize.fetch_post_matrix(limit)
+        if not len(labels) or not len(posts):
+            print("❌ No embeddings found")
+            return
+    benchmark(labels, posts)
+
+
+if __name__ == "__main__":
+    profiling.run(main)
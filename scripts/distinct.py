@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+In-batch deduplication of API inputs.
+
+Hooks like "Stop doing this." repeat across posts, and missing hook / content
+used to be sent as "" inputs. Before an embedding or LLM call, texts are
+normalized (llm_cache.normalize: NFC, collapsed whitespace), empties are
+dropped and identical inputs are sent once; results are then fanned back out
+to every original row. A batch costs its distinct texts, not its rows.
+
+    results = distinct.map_unique(request_embeddings, texts)   # None for empties
+"""
+
+import llm_cache
+import metrics
+
+
+def unique(texts):
+    """(distinct normalized texts, index) with index[i] the position of texts[i], -1 when empty."""
+    positions = {}
+    index = []
+    for text in texts:
+        key = llm_cache.normalize(text or "")
+        if not key:
+            index.append(-1)
+            continue
+        index.append(positions.setdefault(key, len(positions)))
+    distinct = list(positions)
+    empties = index.count(-1)
+    metrics.incr("inputs_empty", empties)
+    metrics.incr("inputs_deduplicated", len(texts) - empties - len(distinct))
+    return distinct, index
+
+
+def fan_out(results, index, empty=None):
+    """Results for the distinct texts -> one result per original row (`empty` for empty rows)."""
+    return [results[i] if i >= 0 else empty for i in index]
+
+
+def map_unique(fn, texts, empty=None):
+    """fn(list of distinct non-empty texts) -> list of results, applied once per distinct text."""
+    values, index = unique(texts)
+    return fan_out(fn(values) if values else [], index, empty)
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Precomputed per-author top-k engagement ranking of viral_posts_bank.
+
+Ordering by metrics->reactions through PostgREST sorts the author's rows on
+the server for every call (no index on that JSONB path) and misses the rows
+scraped with "likes" / "num_likes". Instead, one pass over id, author_id and
+metrics (the snapshot when there is one, keyset pages otherwise) computes:
+
+    raw score   log1p(reactions + 3 * comments + 5 * shares)
+    normalized  z-score of the raw score within the author (Welford running stats)
+
+and keeps the best ENGAGEMENT_TOP_K posts per author in a bounded min-heap.
+The result is stored as JSON in scripts/cache/engagement_index.json; after
+that "best posts of an author" is a dict lookup. Normalized scores make posts
+comparable across authors (an author with a small audience still contributes
+their best posts to best()).
+
+    python engagement.py build [--k=50] [--snapshot]
+    python engagement.py top <author_id> [--k=20]
+
+    index = engagement.load_index() or engagement.build_index()
+    ids = index.top(author_id, 20)
+"""
+
+import os
+import sys
+import json
+import heapq
+import math
+import time
+from pathlib import Path
+
+import metrics
+import profiling
+import snapshot
+
+INDEX_PATH = Path(os.getenv("ENGAGEMENT_INDEX_PATH", Path(__file__).parent / "cache" / "engagement_index.json"))
+TOP_K = int(os.getenv("ENGAGEMENT_TOP_K", "50"))
+# load_index() ignores older indexes (metrics keep moving after the scrape)
+MAX_AGE_HOURS = float(os.getenv("ENGAGEMENT_INDEX_MAX_AGE_HOURS", "24"))
+
+WEIGHTS = {"reactions": 1.0, "comments": 3.0, "shares": 5.0}
+# Version 1 indexes built from the snapshot left shares out
+INDEX_VERSION = 2
+
+
+def raw_score(post_metrics):
+    """Weighted engagement on a log scale (a viral outlier should not dwarf everything)."""
+    reactions, comments = snapshot.engagement_counts(post_metrics)
+    return counts_score(reactions, comments, snapshot.share_count(post_metrics))
+
+
+def counts_score(reactions, comments, shares):
+    """raw_score() from counts already extracted (snapshot columns)."""
+    return math.log1p(WEIGHTS["reactions"] * reactions + WEIGHTS["comments"] * comments
+                      + WEIGHTS["shares"] * shares)
+
+
+class AuthorRanking:
+    """Bounded min-heap of the k best posts of one author, plus running mean/variance of all its scores."""
+
+    __slots__ = ("k", "heap", "n", "mean", "m2")
+
+    def __init__(self, k):
+        self.k = k
+        self.heap = []
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, post_id, score):
+        self.n += 1
+        delta = score - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (score - self.mean)
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, (score, post_id))
+        elif score > self.heap[0][0]:
+            heapq.heapreplace(self.heap, (score, post_id))
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / self.n) if self.n > 1 else 0.0
+
+    def to_dict(self):
+        std = self.std
+        top = sorted(self.heap, reverse=True)
+        return {
+            "n": self.n,
+            "mean": round(self.mean, 6),
+            "std": round(std, 6),
+            "top": [[post_id, round(score, 6), round((score - self.mean) / std if std else 0.0, 6)]
+                    for score, post_id in top],
+        }
+
+
+def iter_posts(snap=None):
+    """(id, author_id, raw score) for every post with an author, near-duplicate copies excluded."""
+    if snap is not None:
+        ids = snap.column("id")
+        authors = snap.column("author_id")
+        copies = snap.column("duplicate_of")
+        reactions = snap.column("reactions")
+        comments = snap.column("comments")
+        shares = snap.column("shares")
+        for i in range(len(ids)):
+            if authors[i] and not copies[i]:
+                # Same score as raw_score(): both sources write the same index
+                yield ids[i], authors[i], counts_score(int(reactions[i]), int(comments[i]), int(shares[i]))
+        return
+    params = {"author_id": "not.is.null", "duplicate_of": "is.null"}
+    for page in snapshot.fetch_pages(params, "id,author_id,metrics"):
+        for row in page:
+            yield row["id"], row["author_id"], raw_score(row.get("metrics"))
+
+
+class EngagementIndex:
+    def __init__(self, data):
+        self.data = data
+        self.authors = data["authors"]
+        self.k = data["k"]
+
+    @property
+    def age_hours(self):
+        return (time.time() - self.data["built_at"]) / 3600
+
+    def __contains__(self, author_id):
+        return author_id in self.authors
+
+    def top(self, author_id, limit=20):
+        """Ids of the author's best posts, best first (at most k)."""
+        entry = self.authors.get(author_id)
+        return [post_id for post_id, _, _ in entry["top"][:limit]] if entry else []
+
+    def best(self, limit=20, authors=None):
+        """(post_id, author_id, normalized score) of the best posts across authors."""
+        candidates = (
+            (z, post_id, author_id)
+            for author_id, entry in self.authors.items()
+            if authors is None or author_id in authors
+            for post_id, _, z in entry["top"]
+        )
+        return [(post_id, author_id, z) for z, post_id, author_id in heapq.nlargest(limit, candidates)]
+
+
+def build_index(k=TOP_K, snap=None, path=INDEX_PATH):
+    """One pass over all posts -> per-author top-k. Written to path and returned."""
+    rankings = {}
+    total = 0
+    with metrics.stage("rank"):
+        for post_id, author_id, score in iter_posts(snap):
+            ranking = rankings.get(author_id)
+            if ranking is None:
+                ranking = rankings[author_id] = AuthorRanking(k)
+            ranking.add(post_id, score)
+            total += 1
+
+    data = {
+        "version": INDEX_VERSION,
+        "built_at": time.time(),
+        "k": k,
+        "weights": WEIGHTS,
+        "posts": total,
+        "authors": {author_id: r.to_dict() for author_id, r in rankings.items()},
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(data))
+    tmp.replace(path)
+    metrics.incr("items_processed", total)
+    return EngagementIndex(data)
+
+
+def load_index(path=INDEX_PATH, max_age_hours=MAX_AGE_HOURS, min_k=0):
+    """The stored index, or None when missing, stale, of another version or weights, or with a smaller k."""
+    if not path.exists():
+        return None
+    data = json.loads(path.read_text())
+    index = EngagementIndex(data)
+    if data.get("version") != INDEX_VERSION or data.get("weights") != WEIGHTS:
+        return None
+    if index.k < min_k or index.age_hours > max_age_hours:
+        return None
+    return index
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "build"
+    k = TOP_K
+    for arg in sys.argv[2:]:
+        if arg.startswith("--k="):
+            k = int(arg.split("=", 1)[1])
+
+    if command == "top":
+        author_id = sys.argv[2]
+        index = load_index(max_age_hours=float("inf"))
+        if index is None:
+            print("❌ No engagement index, run: python engagement.py build")
+            return
+        for post_id, score, z in index.authors.get(author_id, {}).get("top", [])[:k]:
+            print(f"  {post_id}  raw {score:6.2f}  z {z:+5.2f}")
+        return
+
+    metrics.start_run("engagement:build")
+    snap = snapshot.open_snapshot() if "--snapshot" in sys.argv else None
+    print(f"📈 Ranking posts by engagement (top {k} per author)...")
+    index = build_index(k, snap)
+    print(f"✅ {index.data['posts']} posts, {len(index.authors)} authors -> {INDEX_PATH}")
+
+
+if __name__ == "__main__":
+    profiling.run(main)
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Durable write-behind journal for computed results.
+
+A classification or style result costs embedding / LLM tokens; if the PATCH
+that stores it failed, it used to be counted as a failure and dropped. Now
+every result is first appended to a local SQLite file (WAL mode,
+scripts/cache/journal.sqlite) and write() returns at once; a background
+flusher drains the journal in bulk and deletes entries only once Supabase
+accepted them. Failed entries are retried with exponential backoff (up to
+JOURNAL_MAX_BACKOFF_SECONDS), never dropped; entries left over by a crashed
+or interrupted run are replayed by the next start().
+
+Draining is cheap: several results for the same row are merged into one
+update, and rows receiving the same values (posts classified into the same
+topic...) are written by a single PATCH with id=in.(...), or by one COPY +
+UPDATE ... FROM per table when pg_bulk is available.
+
+Rows are claimed whole, every pending entry at once and merged in write
+order, so the retry of an older result never lands after a newer one. A
+pg_bulk unit the database rejects (FK violation on a deleted label...) is
+bisected until the bad rows fail on their own and the others are written.
+
+Bypass with --no-journal or WRITE_JOURNAL=0 (writes go straight to PostgREST).
+
+    journal.start()
+    journal.write("viral_posts_bank", post_id, {"topic_id": topic_id})
+    journal.close()    # flush before leases are released
+
+    python journal.py status | replay
+"""
+
+import os
+import sys
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import metrics
+import pg_bulk
+import profiling
+import supabase_rest
+
+JOURNAL_PATH = Path(os.getenv("WRITE_JOURNAL_PATH", Path(__file__).parent / "cache" / "journal.sqlite"))
+BYPASS = os.getenv("WRITE_JOURNAL", "1") == "0" or "--no-journal" in sys.argv
+
+# Entries claimed per drain, rows per PATCH id=in.(...)
+FLUSH_BATCH = 500
+PATCH_IDS = 200
+FLUSH_INTERVAL_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = float(os.getenv("JOURNAL_MAX_BACKOFF_SECONDS", "300"))
+# A claim by a process that died is taken over after this delay
+CLAIM_TIMEOUT_SECONDS = 120
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name TEXT NOT NULL,
+    row_id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    claimed_by TEXT,
+    claimed_at REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_entries_next ON entries(next_attempt_at);
+CREATE INDEX IF NOT EXISTS idx_entries_row ON entries(table_name, row_id);
+"""
+
+_local = threading.local()
+_wake = threading.Event()
+_stop = threading.Event()
+_flusher = None
+OWNER = f"{os.getpid()}"
+
+
+def _connect():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        JOURNAL_PATH.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(JOURNAL_PATH, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def write(table, row_id, data):
+    """Record an update of one row (by id). Returns True once it is durable locally (or written, if bypassed)."""
+    if BYPASS:
+        return supabase_rest.patch(table, {"id": f"eq.{row_id}"}, data)
+    _connect().execute(
+        "INSERT INTO entries (table_name, row_id, data, created_at) VALUES (?, ?, ?, ?)",
+        (table, str(row_id), json.dumps(data, sort_keys=True), time.time()))
+    metrics.incr("journal_written")
+    _wake.set()
+    return True
+
+
+def pending():
+    """Number of entries not written back yet."""
+    return _connect().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+def pending_rows(table):
+    """Ids of the `table` rows with results not written back yet."""
+    if BYPASS:
+        return set()
+    return {row_id for (row_id,) in _connect().execute(
+        "SELECT DISTINCT row_id FROM entries WHERE table_name = ?", (table,))}
+
+
+def _claim(limit):
+    """Take every entry of up to `limit` rows with a due entry (ours or abandoned), oldest first.
+
+    A row is claimed whole: a newer result is never written before (and then
+    overwritten by) the retry of an older one that is backed off. Rows with an
+    entry being written by someone else are left for later.
+    """
+    conn = _connect()
+    now = time.time()
+    stale = now - CLAIM_TIMEOUT_SECONDS
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = conn.execute(
+            "SELECT e.id, e.table_name, e.row_id, e.data, e.attempts FROM entries e "
+            "JOIN (SELECT table_name, row_id FROM entries "
+            "      WHERE next_attempt_at <= ? AND (claimed_by IS NULL OR claimed_at < ?) "
+            "      GROUP BY table_name, row_id ORDER BY MIN(id) LIMIT ?) due "
+            "  ON e.table_name = due.table_name AND e.row_id = due.row_id "
+            "WHERE NOT EXISTS (SELECT 1 FROM entries o WHERE o.table_name = e.table_name "
+            "                  AND o.row_id = e.row_id AND o.claimed_by IS NOT NULL AND o.claimed_at >= ?) "
+            "ORDER BY e.id",
+            (now, stale, limit, stale)).fetchall()
+        conn.executemany("UPDATE entries SET claimed_by = ?, claimed_at = ? WHERE id = ?",
+                         [(OWNER, now, r[0]) for r in rows])
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return rows
+
+
+def _coalesce(rows):
+    """{(table, data json): {row_id: [entry ids]}}, later results for a row overriding earlier ones."""
+    merged = {}
+    for entry_id, table, row_id, data, _ in rows:
+        current = merged.setdefault((table, row_id), [{}, []])
+        current[0].update(json.loads(data))
+        current[1].append(entry_id)
+    groups = {}
+    for (table, row_id), (data, entry_ids) in merged.items():
+        groups.setdefault((table, json.dumps(data, sort_keys=True)), {})[row_id] = entry_ids
+    return groups
+
+
+def _batches(rows):
+    """(table, [(row_id, data, entry ids)]) write-back units for claimed entries."""
+    groups = _coalesce(rows)
+    if pg_bulk.available():
+        # One COPY + UPDATE ... FROM per table, whatever the values
+        by_table = {}
+        for (table, data), by_row in groups.items():
+            by_table.setdefault(table, []).extend(
+                (row_id, json.loads(data), entry_ids) for row_id, entry_ids in by_row.items())
+        yield from by_table.items()
+        return
+    for (table, data), by_row in groups.items():
+        row_ids = list(by_row)
+        for start in range(0, len(row_ids), PATCH_IDS):
+            yield table, [(row_id, json.loads(data), by_row[row_id]) for row_id in row_ids[start:start + PATCH_IDS]]
+
+
+def _write_back(units):
+    """Write (table, updates) units; returns True, False or the exception, per unit.
+
+    Units share their data unless they go through pg_bulk; PATCH units are sent
+    concurrently (supabase_rest.gather).
+    """
+    if not pg_bulk.available():
+        return supabase_rest.gather([
+            ("patch", table, {"id": f"in.({','.join(row_id for row_id, _, _ in updates)})"}, updates[0][1])
+            for table, updates in units
+        ], return_exceptions=True)
+    results = []
+    for table, updates in units:
+        try:
+            pg_bulk.update_rows(table, [{"id": row_id, **data} for row_id, data, _ in updates])
+            results.append(True)
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def _rejected_rows(result):
+    """True when a failed pg_bulk unit may be down to some of its rows (not a lost connection)."""
+    psycopg = pg_bulk._import()
+    return (isinstance(result, psycopg.Error)
+            and not isinstance(result, (psycopg.OperationalError, psycopg.InterfaceError)))
+
+
+def _write_back_split(units):
+    """(unit, result) for every unit; a pg_bulk unit rejected by the database is bisected
+    until the offending rows fail on their own and the others are written."""
+    settled = []
+    while units:
+        retry = []
+        for unit, result in zip(units, _write_back(units)):
+            table, updates = unit
+            if result is True or len(updates) == 1 or not pg_bulk.available() or not _rejected_rows(result):
+                settled.append((unit, result))
+                continue
+            middle = len(updates) // 2
+            retry += [(table, updates[:middle]), (table, updates[middle:])]
+            metrics.incr("journal_splits")
+        units = retry
+    return settled
+
+
+def drain(limit=FLUSH_BATCH):
+    """Write back up to `limit` due entries. Returns (written, failed) entry counts."""
+    rows = _claim(limit)
+    if not rows:
+        return 0, 0
+    attempts = {r[0]: r[4] for r in rows}
+    conn = _connect()
+    written = failed = 0
+    for (table, updates), result in _write_back_split(list(_batches(rows))):
+        entry_ids = [e for _, _, row_entries in updates for e in row_entries]
+        if isinstance(result, Exception):
+            ok, error = False, str(result)[:200]
+        else:
+            ok, error = result, None if result else "PATCH rejected"
+        if ok:
+            conn.executemany("DELETE FROM entries WHERE id = ?", [(e,) for e in entry_ids])
+            written += len(entry_ids)
+            metrics.incr("journal_flushed", len(entry_ids))
+            metrics.incr("journal_patches")
+            continue
+        now = time.time()
+        backoff = []
+        for _, _, row_entries in updates:
+            # A row's entries are retried together, on the backoff of its most retried one
+            delay = min(2 ** max(attempts[e] for e in row_entries), MAX_BACKOFF_SECONDS)
+            backoff += [(now + delay, error, e) for e in row_entries]
+        conn.executemany(
+            "UPDATE entries SET attempts = attempts + 1, next_attempt_at = ?, last_error = ?, "
+            "claimed_by = NULL WHERE id = ?", backoff)
+        failed += len(entry_ids)
+        metrics.retry("journal", len(entry_ids))
+    return written, failed
+
+
+def flush():
+    """Write back every due entry now, without waiting for the flusher. Returns the entries written."""
+    if BYPASS:
+        return 0
+    written = 0
+    while True:
+        n = drain()[0]
+        if not n:
+            return written
+        written += n
+
+
+def _run():
+    while not _stop.is_set():
+        _wake.wait(FLUSH_INTERVAL_SECONDS)
+        _wake.clear()
+        try:
+            while drain()[0]:
+                pass
+        except Exception as e:
+            # The entries stay in the journal; next tick retries
+            print(f"  ⚠️ Journal flush error: {e}")
+
+
+def start():
+    """Start the background flusher; entries left by earlier runs are replayed first."""
+    global _flusher
+    if BYPASS or (_flusher is not None and _flusher.is_alive()):
+        return
+    left = pending()
+    if left:
+        print(f"📒 Replaying {left} journaled results not written back yet")
+        metrics.incr("journal_replayed", left)
+    _stop.clear()
+    _flusher = threading.Thread(target=_run, name="journal-flusher", daemon=True)
+    _flusher.start()
+    _wake.set()
+
+
+def close(timeout=30):
+    """Stop the flusher and write back what is due. Returns the number of entries still pending."""
+    global _flusher
+    if BYPASS:
+        return 0
+    if _flusher is not None:
+        _stop.set()
+        _wake.set()
+        _flusher.join()
+        _flusher = None
+    deadline = time.time() + timeout
+    # Failed entries are backed off, so this stops once nothing due is left
+    while time.time() < deadline and drain()[0]:
+        pass
+    left = pending()
+    if left:
+        print(f"  ⚠️ {left} results kept in {JOURNAL_PATH}, written back on the next run")
+    return left
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    conn = _connect()
+    if command == "replay":
+        metrics.start_run("journal:replay")
+        # Retry everything now, backoff included
+        conn.execute("UPDATE entries SET next_attempt_at = 0, claimed_by = NULL")
+        print(f"📒 Replaying {pending()} entries...")
+        left = close(timeout=float("inf"))
+        print(f"✅ {left} entries left")
+        return
+
+    print(f"📒 {JOURNAL_PATH}")
+    for table, count, oldest, attempts in conn.execute(
+            "SELECT table_name, COUNT(*), MIN(created_at), MAX(attempts) FROM entries GROUP BY table_name"):
+        age = (time.time() - oldest) / 60
+        print(f"  {table}: {count} pending (oldest {age:.0f} min, max attempts {attempts})")
+    for error, count in conn.execute(
+            "SELECT last_error, COUNT(*) FROM entries WHERE last_error IS NOT NULL GROUP BY last_error LIMIT 5"):
+        print(f"  last error ({count}): {error}")
+
+
+if __name__ == "__main__":
+    profiling.run(main)
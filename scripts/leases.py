@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Lease-based work claiming for the classifiers.
+
+Each process claims a disjoint batch of unclassified posts through the
+claim_posts_for_classification RPC (FOR UPDATE SKIP LOCKED + expiry), keeps the
+leases alive while it works and releases them when done, so N copies of
+classify_posts_batch.py / classify_posts.py can run on N machines without
+embedding or paying for the same rows.
+
+If the migration is not applied yet, claim() falls back to a plain select.
+Results are journaled (journal.py), so the fallback first writes back what is
+due and skips rows whose results are still pending: without leases, nothing
+else keeps the next claim from returning (and paying again for) the same rows.
+claim_flagged() does the same for the needs_* flags drained by worker.py.
+
+Both RPCs hand out work by priority (20260209_classification_priority.sql):
+a stored score (post date, engagement, studio authors) with authors taking
+turns inside a batch, and a share of each batch reserved for posts waiting
+longer than max_wait_hours. Weights live in classification_priority_settings.
+
+content_chars trims the content they return (20260210_claim_projection.sql):
+None for the full post, n for its first n characters, 0 for none at all, the
+hook then falling back to the first line of the content server-side.
+"""
+
+import os
+import socket
+import threading
+import uuid
+from contextlib import contextmanager
+
+import requests
+
+import journal
+import metrics
+import supabase_rest
+
+LEASE_SECONDS = int(os.getenv("CLASSIFY_LEASE_SECONDS", "300"))
+
+OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# Null column that marks a post as unclassified for each task
+TASK_COLUMNS = {
+    "topic": "topic_id",
+    "hook": "hook_type_id",
+    "structure": "structure_id",
+    "audience": "audience_id",
+}
+
+# Posts whose labels came from the rule-based fallback (20260208_llm_reclassification.sql)
+RECLASSIFY_TASK = "reclassify"
+
+# needs_* flags drained by worker.py, claimed with task = flag name
+FLAG_COLUMNS = [
+    "needs_embedding",
+    "needs_hook_classification",
+    "needs_topic_classification",
+    "needs_audience_classification",
+]
+
+_rpc_available = True
+_projection_available = True
+
+
+def _claim_rpc(function, params, content_chars):
+    """(status, body) of a claim RPC, without p_content_chars if the projection migration is missing."""
+    global _projection_available
+    if content_chars is not None and _projection_available:
+        status, body = supabase_rest.rpc(function, {**params, "p_content_chars": content_chars})
+        if status != 404:
+            return status, body
+        print(f"⚠️ {function} has no p_content_chars, claiming full content")
+        _projection_available = False
+    return supabase_rest.rpc(function, params)
+
+
+def claim(task, limit=100, lease_seconds=LEASE_SECONDS, content_chars=None):
+    """Lease up to `limit` unclassified posts for a task (or RECLASSIFY_TASK). Returns [{id, content, hook}]."""
+    global _rpc_available
+    if _rpc_available:
+        status, body = _claim_rpc("claim_posts_for_classification", {
+            "p_task": task,
+            "p_owner": OWNER,
+            "p_limit": limit,
+            "p_lease_seconds": lease_seconds
+        }, content_chars)
+        if status == 200:
+            metrics.incr("leases_claimed", len(body or []))
+            return body or []
+        if status == 404:
+            print("⚠️ claim_posts_for_classification not found, running without leases")
+            _rpc_available = False
+        else:
+            print(f"  ❌ Claim error {status}: {str(body)[:200]}")
+            return []
+
+    if task == RECLASSIFY_TASK:
+        pending = {"needs_llm_classification": "is.true"}
+    else:
+        pending = {TASK_COLUMNS[task]: "is.null"}
+    # Rows classified a moment ago may not be written back yet
+    journal.flush()
+    skip = journal.pending_rows("viral_posts_bank")
+    rows = supabase_rest.select("viral_posts_bank", {
+        "select": "id,content,hook",
+        **pending,
+        "order": "created_at.desc",
+        "limit": limit + len(skip)
+    })
+    return [r for r in rows if r["id"] not in skip][:limit]
+
+
+def claim_flagged(flag, limit=50, lease_seconds=LEASE_SECONDS, content_chars=None):
+    """Lease up to `limit` posts whose needs_* flag is set. Returns [{id, content, hook}]."""
+    if flag not in FLAG_COLUMNS:
+        raise ValueError(f"Unknown flag '{flag}', expected one of {FLAG_COLUMNS}")
+    status, body = _claim_rpc("claim_flagged_posts", {
+        "p_flag": flag,
+        "p_owner": OWNER,
+        "p_limit": limit,
+        "p_lease_seconds": lease_seconds
+    }, content_chars)
+    if status != 200:
+        print(f"  ❌ Claim error ({flag}) {status}: {str(body)[:200]}")
+        return []
+    metrics.incr("leases_claimed", len(body or []))
+    return body or []
+
+
+def renew(task, post_ids, lease_seconds=LEASE_SECONDS):
+    """Extend our leases on post_ids."""
+    if not _rpc_available or not post_ids:
+        return 0
+    try:
+        status, body = supabase_rest.rpc("renew_post_leases", {
+            "p_task": task,
+            "p_owner": OWNER,
+            "p_post_ids": list(post_ids),
+            "p_lease_seconds": lease_seconds
+        })
+    except requests.RequestException as e:
+        # A missed heartbeat is retried on the next tick
+        print(f"  ⚠️ Lease renewal failed: {e}")
+        metrics.retry("lease_renew")
+        return 0
+    if status != 200:
+        metrics.retry("lease_renew")
+        return 0
+    return body
+
+
+def release(task, post_ids=None):
+    """Release our leases on post_ids (all of ours for the task if None)."""
+    if not _rpc_available:
+        return 0
+    try:
+        status, body = supabase_rest.rpc("release_post_leases", {
+            "p_task": task,
+            "p_owner": OWNER,
+            "p_post_ids": list(post_ids) if post_ids is not None else None
+        })
+    except requests.RequestException as e:
+        # Leases expire on their own after LEASE_SECONDS
+        print(f"  ⚠️ Lease release failed: {e}")
+        return 0
+    return body if status == 200 else 0
+
+
+@contextmanager
+def hold(task, post_ids, lease_seconds=LEASE_SECONDS):
+    """Renew leases in the background while a batch is being processed."""
+    stop = threading.Event()
+
+    def heartbeat():
+        while not stop.wait(lease_seconds / 3):
+            renew(task, post_ids, lease_seconds)
+            metrics.incr("lease_renewals")
+
+    thread = threading.Thread(target=heartbeat, name="lease-heartbeat", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
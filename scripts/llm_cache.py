@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Persistent response cache for the OpenAI chat / responses calls.
+
+Keyed by (endpoint, model, temperature, hash of the normalized request), so a
+rerun, a retry after a partial failure or a duplicated hook is answered from a
+local SQLite file instead of spending tokens again. Entries expire after
+LLM_CACHE_TTL_DAYS and the least recently used ones are evicted once the file
+holds more than LLM_CACHE_MAX_MB of responses.
+
+Bypass with --no-llm-cache or LLM_CACHE=0.
+
+    response = llm_cache.post(url, headers=headers, json=data, timeout=30)
+
+    python llm_cache.py stats | prune | clear
+"""
+
+import os
+import sys
+import json
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+
+import requests
+
+import breaker
+import metrics
+import profiling
+import ratelimit
+
+CACHE_PATH = Path(os.getenv("LLM_CACHE_PATH", Path(__file__).parent / "cache" / "llm_cache.sqlite"))
+TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_DAYS", "30")) * 86400
+MAX_BYTES = int(float(os.getenv("LLM_CACHE_MAX_MB", "200")) * 1024 * 1024)
+
+BYPASS = os.getenv("LLM_CACHE", "1") == "0" or "--no-llm-cache" in sys.argv
+
+# Check the size bound every N writes
+EVICT_EVERY = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT,
+    temperature REAL,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used_at);
+"""
+
+_local = threading.local()
+_writes = 0
+_writes_lock = threading.Lock()
+
+
+class CachedResponse:
+    """Enough of requests.Response for the callers: status_code, json(), text."""
+
+    status_code = 200
+
+    def __init__(self, body):
+        self.text = json.dumps(body)
+
+    def json(self):
+        return json.loads(self.text)
+
+
+def _connect():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(CACHE_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def normalize(text):
+    """Unicode NFC, collapsed whitespace: cosmetic prompt differences share an entry."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+
+def _normalize_value(value):
+    if isinstance(value, str):
+        return normalize(value)
+    if isinstance(value, list):
+        return [_normalize_value(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _normalize_value(v) for k, v in value.items()}
+    return value
+
+
+def make_key(url, data):
+    """Cache key for a request body: endpoint, model, temperature and request hash."""
+    payload = json.dumps(_normalize_value(data), sort_keys=True, ensure_ascii=False)
+    digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    endpoint = url.rstrip("/").rsplit("/", 1)[-1]
+    return f"{endpoint}:{data.get('model')}:{data.get('temperature')}:{digest}"
+
+
+def get(key):
+    """Cached response body for a key, or None (missing or expired)."""
+    conn = _connect()
+    row = conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+    if not row:
+        return None
+    response, created_at = row
+    if time.time() - created_at > TTL_SECONDS:
+        with conn:
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+        return None
+    with conn:
+        conn.execute("UPDATE responses SET last_used_at = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+    return json.loads(response)
+
+
+def put(key, data, body):
+    global _writes
+    response = json.dumps(body, ensure_ascii=False)
+    now = time.time()
+    conn = _connect()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, model, temperature, response, size, created_at, last_used_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, data.get("model"), data.get("temperature"), response, len(response), now, now)
+        )
+    # put() runs from worker threads and gather(): count under a lock so eviction runs once per EVICT_EVERY
+    with _writes_lock:
+        _writes += 1
+        evict = _writes % EVICT_EVERY == 0
+    if evict:
+        prune()
+
+
+def prune():
+    """Drop expired entries, then least recently used ones until under MAX_BYTES."""
+    conn = _connect()
+    with conn:
+        expired = conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - TTL_SECONDS,)).rowcount
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        evicted = 0
+        if total > MAX_BYTES:
+            # Evict down to 90% so we do not prune on every write
+            target = total - int(MAX_BYTES * 0.9)
+            freed = 0
+            keys = []
+            for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_used_at"):
+                keys.append((key,))
+                freed += size
+                if freed >= target:
+                    break
+            conn.executemany("DELETE FROM responses WHERE key = ?", keys)
+            evicted = len(keys)
+    metrics.incr("llm_cache_evicted", evicted)
+    return expired, evicted
+
+
+def post(url, headers=None, json=None, timeout=None, session=None):
+    """requests.post() with the response cache in front. Only 200 responses are stored.
+
+    Misses go through the "openai_chat" circuit breaker (breaker.CircuitOpen while it is open)
+    and the shared "openai_chat" rate limits.
+
+    Hits come back without `usage`, so metrics.record_usage() does not count
+    tokens that were not spent.
+    """
+    data = json
+    chat = breaker.get("openai_chat")
+    send = lambda: ratelimit.call(
+        "openai_chat",
+        lambda: chat.call(lambda: (session or requests).post(url, headers=headers, json=data, timeout=timeout)),
+        ratelimit.chat_tokens(data), key=(headers or {}).get("Authorization"), settle_usage=True)
+    if BYPASS:
+        return send()
+
+    key = make_key(url, data)
+    body = get(key)
+    if body is not None:
+        metrics.incr("llm_cache_hits")
+        usage = body.pop("usage", None) or {}
+        metrics.incr("llm_cache_tokens_saved", usage.get("total_tokens", 0))
+        return CachedResponse(body)
+
+    metrics.incr("llm_cache_misses")
+    response = send()
+    if response.status_code == 200:
+        try:
+            put(key, data, response.json())
+        except (ValueError, sqlite3.Error) as e:
+            print(f"  ⚠️ LLM cache write failed: {e}")
+    return response
+
+
+def stats():
+    conn = _connect()
+    count, size, hits = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(hits), 0) FROM responses"
+    ).fetchone()
+    by_model = conn.execute(
+        "SELECT model, COUNT(*), COALESCE(SUM(hits), 0) FROM responses GROUP BY model ORDER BY COUNT(*) DESC"
+    ).fetchall()
+    return {"entries": count, "bytes": size, "hits": hits, "by_model": by_model}
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    if command == "clear":
+        with _connect() as conn:
+            conn.execute("DELETE FROM responses")
+        print(f"🧹 Cleared {CACHE_PATH}")
+    elif command == "prune":
+        expired, evicted = prune()
+        print(f"🧹 {expired} expired, {evicted} evicted")
+    else:
+        s = stats()
+        print(f"🗄️ {CACHE_PATH}")
+        print(f"  {s['entries']} entries, {s['bytes'] / 1e6:.1f} MB, {s['hits']} hits served")
+        for model, count, hits in s["by_model"]:
+            print(f"  {model:20} {count:8} entries {hits:8} hits")
+
+
+if __name__ == "__main__":
+    profiling.run(main)
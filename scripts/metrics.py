@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Lightweight instrumentation for the Python scripts.
+Stage timers, counters and histograms, with a summary printed at exit and an
+optional row in task_execution_logs_v2 (same shape as the Deno V2 workers).
+
+Usage:
+    import metrics
+
+    metrics.start_run("classify_posts_batch")
+    with metrics.stage("fetch"):
+        posts = fetch_unclassified_posts()
+    metrics.incr("items_found", len(posts))
+    metrics.retry("journal")
+"""
+
+import os
+import atexit
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import requests
+
+SUPABASE_URL = os.getenv("SUPABASE_URL", "https://qzorivymybqavkxexrbf.supabase.co")
+# Inserting into task_execution_logs_v2 needs the service role key
+SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("SUPABASE_KEY", "")
+
+# Set SCRIPT_METRICS_LOG=1 to write a task_execution_logs_v2 row at exit
+LOG_TO_DB = os.getenv("SCRIPT_METRICS_LOG", "") == "1"
+
+_lock = threading.Lock()
+
+STAGES = defaultdict(lambda: {"calls": 0, "wall": 0.0, "cpu": 0.0})
+COUNTERS = defaultdict(int)
+HISTOGRAMS = defaultdict(list)
+
+# Active stage names per thread id (read by the sampling profiler)
+ACTIVE_STAGES = defaultdict(list)
+
+RUN = {
+    "worker_name": None,
+    "started_at": None,
+    "t0": None,
+    "error": None,
+    "log_to_db": False,
+}
+
+# Keys reported by the three OpenAI endpoints we call
+# (embeddings, chat completions, responses)
+USAGE_KEYS = {
+    "prompt_tokens": "tokens_in",
+    "input_tokens": "tokens_in",
+    "completion_tokens": "tokens_out",
+    "output_tokens": "tokens_out",
+}
+
+
+def start_run(worker_name, log_to_db=None):
+    """Start a run: reset state, instrument HTTP calls, report at exit."""
+    reset()
+    RUN["worker_name"] = worker_name
+    RUN["started_at"] = datetime.now(timezone.utc)
+    RUN["t0"] = time.perf_counter()
+    RUN["log_to_db"] = LOG_TO_DB if log_to_db is None else log_to_db
+    instrument_requests()
+    atexit.register(_finish)
+
+
+def reset():
+    """Clear all collected metrics."""
+    with _lock:
+        STAGES.clear()
+        COUNTERS.clear()
+        HISTOGRAMS.clear()
+    RUN["error"] = None
+
+
+@contextmanager
+def stage(name):
+    """Time a block of work (wall clock and CPU of the current thread)."""
+    active = ACTIVE_STAGES[threading.get_ident()]
+    active.append(name)
+    wall0 = time.perf_counter()
+    cpu0 = time.thread_time()
+    try:
+        yield
+    finally:
+        active.pop()
+        wall = time.perf_counter() - wall0
+        cpu = time.thread_time() - cpu0
+        with _lock:
+            s = STAGES[name]
+            s["calls"] += 1
+            s["wall"] += wall
+            s["cpu"] += cpu
+            HISTOGRAMS[f"stage.{name}_ms"].append(wall * 1000)
+
+
+def current_stage(thread_id=None):
+    """Name of the innermost active stage of a thread, or None."""
+    active = ACTIVE_STAGES.get(thread_id or threading.get_ident())
+    return active[-1] if active else None
+
+
+def incr(name, n=1):
+    """Increment a counter."""
+    with _lock:
+        COUNTERS[name] += n
+
+
+def retry(kind, n=1):
+    """Count work that has to be done again (backoff, 429 pause, failed renewal...)."""
+    with _lock:
+        COUNTERS["retries"] += n
+        COUNTERS[f"retries.{kind}"] += n
+
+
+def observe(name, value):
+    """Record a value in a histogram."""
+    with _lock:
+        HISTOGRAMS[name].append(value)
+
+
+def record_usage(usage, model=None):
+    """Count tokens from an OpenAI `usage` object."""
+    if not usage:
+        return
+    for key, counter in USAGE_KEYS.items():
+        if usage.get(key):
+            incr(counter, usage[key])
+            if model:
+                incr(f"{counter}.{model}", usage[key])
+
+
+def mark_failed(error):
+    """Flag the run as failed; the message ends up in error_message."""
+    RUN["error"] = str(error)
+
+
+_original_request = requests.Session.request
+
+
+def _instrumented_request(self, method, url, *args, **kwargs):
+    host = url.split("/")[2] if "://" in url else url
+    t0 = time.perf_counter()
+    try:
+        response = _original_request(self, method, url, *args, **kwargs)
+    except Exception:
+        incr("http_errors")
+        incr(f"http_errors.{host}")
+        raise
+    finally:
+        incr("http_calls")
+        incr(f"http_calls.{host}")
+        observe(f"http.{host}_ms", (time.perf_counter() - t0) * 1000)
+    if response.status_code == 429:
+        incr("http_429")
+    elif response.status_code >= 400:
+        incr("http_errors")
+        incr(f"http_errors.{host}")
+    return response
+
+
+def instrument_requests():
+    """Count and time every call made through `requests`."""
+    requests.Session.request = _instrumented_request
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0
+    k = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def summary():
+    """Return collected metrics as a JSON-serialisable dict."""
+    with _lock:
+        stages = {
+            name: {
+                "calls": s["calls"],
+                "wall_ms": round(s["wall"] * 1000),
+                "cpu_ms": round(s["cpu"] * 1000),
+                "io_wait_ms": round(max(0.0, s["wall"] - s["cpu"]) * 1000),
+            }
+            for name, s in STAGES.items()
+        }
+        histograms = {}
+        for name, values in HISTOGRAMS.items():
+            ordered = sorted(values)
+            histograms[name] = {
+                "count": len(ordered),
+                "mean": round(sum(ordered) / len(ordered), 2) if ordered else 0,
+                "p50": round(_percentile(ordered, 50), 2),
+                "p95": round(_percentile(ordered, 95), 2),
+                "max": round(ordered[-1], 2) if ordered else 0,
+            }
+        counters = dict(COUNTERS)
+
+    duration_ms = round((time.perf_counter() - RUN["t0"]) * 1000) if RUN["t0"] else 0
+    return {
+        "worker_name": RUN["worker_name"],
+        "duration_ms": duration_ms,
+        "stages": stages,
+        "retries": counters.get("retries", 0),
+        "counters": counters,
+        "histograms": histograms,
+    }
+
+
+def print_summary(data=None):
+    """Print a human readable summary of the run."""
+    data = data or summary()
+    print("\n" + "=" * 60)
+    print(f"⏱️  {data['worker_name'] or 'run'} - {data['duration_ms'] / 1000:.1f}s")
+    print("=" * 60)
+    if data["retries"]:
+        print(f"🔁 {data['retries']} retries")
+
+    if data["stages"]:
+        print(f"{'stage':20} {'calls':>6} {'wall':>9} {'cpu':>9} {'io wait':>9}")
+        for name, s in sorted(data["stages"].items(), key=lambda kv: -kv[1]["wall_ms"]):
+            print(f"{name:20} {s['calls']:6} {s['wall_ms']:7}ms {s['cpu_ms']:7}ms {s['io_wait_ms']:7}ms")
+
+    if data["counters"]:
+        print()
+        for name, value in sorted(data["counters"].items()):
+            print(f"{name:40} {value}")
+
+    if data["histograms"]:
+        print()
+        for name, h in sorted(data["histograms"].items()):
+            print(f"{name:40} n={h['count']} p50={h['p50']} p95={h['p95']} max={h['max']}")
+
+
+def log_execution(data=None):
+    """Insert a task_execution_logs_v2 row describing this run."""
+    if not SUPABASE_SERVICE_KEY:
+        print("⚠️ SUPABASE_SERVICE_ROLE_KEY not set, skipping task_execution_logs_v2")
+        return False
+
+    data = data or summary()
+    counters = data["counters"]
+    row = {
+        "worker_name": f"py:{data['worker_name']}",
+        "started_at": RUN["started_at"].isoformat(),
+        "completed_at": datetime.now(timezone.utc).isoformat(),
+        "status": "failed" if RUN["error"] else "completed",
+        "items_found": counters.get("items_found", 0),
+        "items_processed": counters.get("items_processed", 0),
+        "items_failed": counters.get("items_failed", 0),
+        "duration_ms": data["duration_ms"],
+        "error_message": RUN["error"],
+        "metadata": {
+            "retries": data["retries"],
+            "stages": data["stages"],
+            "counters": counters,
+            "histograms": data["histograms"],
+        },
+    }
+    headers = {
+        "apikey": SUPABASE_SERVICE_KEY,
+        "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
+        "Content-Type": "application/json",
+        "Prefer": "return=minimal",
+    }
+    try:
+        response = _original_request(
+            requests.Session(), "POST", f"{SUPABASE_URL}/rest/v1/task_execution_logs_v2",
+            headers=headers, json=row, timeout=10
+        )
+        return response.status_code in [200, 201, 204]
+    except Exception as e:
+        print(f"⚠️ Could not write task_execution_logs_v2: {e}")
+        return False
+
+
+def flush():
+    """Report the metrics collected so far and start a new window (long-running workers)."""
+    if RUN["t0"] is None:
+        return
+    data = summary()
+    print_summary(data)
+    if RUN["log_to_db"]:
+        log_execution(data)
+    reset()
+    RUN["started_at"] = datetime.now(timezone.utc)
+    RUN["t0"] = time.perf_counter()
+
+
+def _finish():
+    if RUN["t0"] is None:
+        return
+    data = summary()
+    print_summary(data)
+    if RUN["log_to_db"]:
+        log_execution(data)
+    RUN["t0"] = None
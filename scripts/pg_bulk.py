@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Direct Postgres bulk path for large loads and write-backs.
+
+PostgREST turns every row into JSON over HTTPS and every PATCH into its own
+statement: fine for a batch of 50, hours for a 1M-row backfill. With
+DATABASE_URL set and psycopg installed, the ingestion and write-back layers
+use this module instead:
+
+    1. CREATE TEMP TABLE <stage> AS SELECT <columns> FROM <table> WITH NO DATA
+       (same column types as the target, vector and jsonb included)
+    2. COPY <stage> FROM STDIN, rows streamed by psycopg
+    3. one set-based statement:
+         UPDATE <table> t SET c = s.c ... FROM <stage> s WHERE t.id = s.id
+         INSERT INTO <table> SELECT ... FROM <stage> ON CONFLICT DO NOTHING
+
+Rows are sent in chunks of PG_BULK_CHUNK_ROWS, one transaction each, so a
+long backfill neither holds its locks for the whole run nor loses it all on
+an error. Without DATABASE_URL / psycopg (or with --no-pg-bulk / PG_BULK=0)
+callers keep going through PostgREST.
+
+    if pg_bulk.available():
+        ids = pg_bulk.update_rows("viral_posts_bank", [{"id": ..., "embedding": vector}, ...])
+        ids = pg_bulk.insert_rows("viral_posts_bank", rows)
+
+    python pg_bulk.py check    # round trip on temp tables (local Postgres + pgvector)
+"""
+
+import os
+import sys
+import json
+import threading
+import time
+import uuid
+from itertools import islice
+
+import numpy as np
+
+import metrics
+import profiling
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+BYPASS = os.getenv("PG_BULK", "1") == "0" or "--no-pg-bulk" in sys.argv
+CHUNK_ROWS = int(os.getenv("PG_BULK_CHUNK_ROWS", "50000"))
+
+_local = threading.local()
+_psycopg = None
+_types = {}
+
+
+def _import():
+    """psycopg, or False when it is not installed."""
+    global _psycopg
+    if _psycopg is None:
+        try:
+            import psycopg
+            _psycopg = psycopg
+        except ImportError:
+            _psycopg = False
+    return _psycopg
+
+
+def available():
+    """True when bulk writes can go straight to Postgres."""
+    return bool(DATABASE_URL) and not BYPASS and bool(_import())
+
+
+def _connect():
+    conn = getattr(_local, "conn", None)
+    if conn is None or conn.closed:
+        conn = _import().connect(DATABASE_URL, autocommit=True)
+        _local.conn = conn
+    return conn
+
+
+def column_types(table):
+    """{column: formatted type} of a table, e.g. {"embedding": "vector(1536)", "metrics": "jsonb"}."""
+    if table not in _types:
+        rows = _connect().execute(
+            "SELECT attname, format_type(atttypid, atttypmod) FROM pg_attribute "
+            "WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped", (table,)).fetchall()
+        _types[table] = dict(rows)
+    return _types[table]
+
+
+def to_copy(value, pg_type):
+    """A Python value as psycopg should write it in a COPY row for a column of pg_type."""
+    if isinstance(value, np.ndarray):
+        value = value.tolist()
+    if value is None or pg_type.endswith("[]"):
+        return value
+    if isinstance(value, (dict, list)):
+        # jsonb, and "[0.1,...]" is also the vector text format
+        return json.dumps(value)
+    return value
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _by_columns(rows):
+    """Rows grouped by their column set (a missing column is left alone, not set to NULL)."""
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    return groups
+
+
+def _stage(cur, table, columns, rows):
+    """Temp table shaped like table(columns), loaded with COPY. Returns its name."""
+    sql = _import().sql
+    types = column_types(table)
+    missing = [c for c in columns if c not in types]
+    if missing:
+        raise ValueError(f"Unknown columns for {table}: {missing}")
+    stage = f"pg_bulk_{uuid.uuid4().hex[:12]}"
+    cols = sql.SQL(", ").join(map(sql.Identifier, columns))
+    cur.execute(sql.SQL("CREATE TEMP TABLE {} ON COMMIT DROP AS SELECT {} FROM {} WITH NO DATA").format(
+        sql.Identifier(stage), cols, sql.Identifier(table)))
+    with cur.copy(sql.SQL("COPY {} ({}) FROM STDIN").format(sql.Identifier(stage), cols)) as copy:
+        for row in rows:
+            copy.write_row([to_copy(row[c], types[c]) for c in columns])
+    metrics.incr("pg_copy_rows", len(rows))
+    return stage
+
+
+def update_rows(table, rows, key="id", chunk_rows=CHUNK_ROWS):
+    """UPDATE table from rows ({key: ..., column: value, ...}). Returns the keys of the rows updated."""
+    sql = _import().sql
+    updated = []
+    conn = _connect()
+    for columns, group in _by_columns(rows).items():
+        if key not in columns:
+            raise ValueError(f"Rows for {table} need a '{key}' column")
+        assignments = sql.SQL(", ").join(
+            sql.SQL("{} = s.{}").format(sql.Identifier(c), sql.Identifier(c)) for c in columns if c != key)
+        for chunk in _chunks(group, chunk_rows):
+            # UPDATE ... FROM picks an arbitrary source row per target: keep the last one
+            chunk = list({row[key]: row for row in chunk}.values())
+            with conn.transaction(), conn.cursor() as cur:
+                stage = _stage(cur, table, list(columns), chunk)
+                cur.execute(sql.SQL("UPDATE {} t SET {} FROM {} s WHERE t.{} = s.{} RETURNING t.{}").format(
+                    sql.Identifier(table), assignments, sql.Identifier(stage),
+                    sql.Identifier(key), sql.Identifier(key), sql.Identifier(key)))
+                updated.extend(str(r[0]) for r in cur.fetchall())
+    metrics.incr("pg_rows_updated", len(updated))
+    return updated
+
+
+def insert_rows(table, rows, returning="id", chunk_rows=CHUNK_ROWS):
+    """INSERT rows, skipping those that hit a unique constraint. Returns the `returning` values inserted."""
+    sql = _import().sql
+    inserted = []
+    conn = _connect()
+    for columns, group in _by_columns(rows).items():
+        cols = sql.SQL(", ").join(map(sql.Identifier, columns))
+        for chunk in _chunks(group, chunk_rows):
+            with conn.transaction(), conn.cursor() as cur:
+                stage = _stage(cur, table, list(columns), chunk)
+                cur.execute(sql.SQL("INSERT INTO {} ({}) SELECT {} FROM {} ON CONFLICT DO NOTHING RETURNING {}").format(
+                    sql.Identifier(table), cols, cols, sql.Identifier(stage), sql.Identifier(returning)))
+                inserted.extend(str(r[0]) for r in cur.fetchall())
+    metrics.incr("pg_rows_inserted", len(inserted))
+    return inserted
+
+
+def check(n=20000, dim=8):
+    """Insert then update n rows (vector, jsonb, text[]) in a temp table and verify them."""
+    conn = _connect()
+    conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    conn.execute(f"CREATE TEMP TABLE pg_bulk_check (id uuid PRIMARY KEY, content text NOT NULL, "
+                 f"metrics jsonb, tags text[], embedding vector({dim}), needs_embedding boolean DEFAULT true)")
+    _types.pop("pg_bulk_check", None)
+    rng = np.random.default_rng(0)
+    ids = [str(uuid.uuid4()) for _ in range(n)]
+
+    start = time.perf_counter()
+    rows = [{"id": i, "content": f"post {k}\twith \"quotes\"\nand lines", "metrics": {"likes": k},
+             "tags": ["a", "b,c"]} for k, i in enumerate(ids)]
+    inserted = insert_rows("pg_bulk_check", rows)
+    again = insert_rows("pg_bulk_check", rows[:10])
+    insert_s = time.perf_counter() - start
+
+    vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    start = time.perf_counter()
+    updated = update_rows("pg_bulk_check", [{"id": i, "embedding": v, "needs_embedding": False}
+                                            for i, v in zip(ids, vectors)])
+    update_s = time.perf_counter() - start
+
+    row = conn.execute("SELECT content, metrics, tags, embedding::text, needs_embedding "
+                       "FROM pg_bulk_check WHERE id = %s", (ids[7],)).fetchone()
+    stored = np.array(json.loads(row[3]), dtype=np.float32)
+    assert len(inserted) == n and not again, (len(inserted), len(again))
+    assert len(updated) == n
+    assert row[0] == rows[7]["content"] and row[1] == {"likes": 7} and row[2] == ["a", "b,c"], row
+    assert np.allclose(stored, vectors[7], atol=1e-6) and row[4] is False
+    print(f"  insert {n} rows: {insert_s:.2f}s, update {n} embeddings: {update_s:.2f}s")
+
+
+def main():
+    if not DATABASE_URL or not _import():
+        print("❌ pg_bulk needs DATABASE_URL and psycopg (pip install 'psycopg[binary]')")
+        return
+    if (sys.argv[1] if len(sys.argv) > 1 else "check") == "check":
+        print("🐘 COPY round trip on temp tables...")
+        check()
+        print("✅ pg_bulk OK")
+
+
+if __name__ == "__main__":
+    profiling.run(main)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Common `--profile` entry point for the scripts.
+
+    python classify_posts_batch.py hook --profile            # sampling profiler
+    python classify_posts_batch.py hook --profile=cprofile   # deterministic cProfile
+
+Without the flag (or SCRIPT_PROFILE env var) main() is called directly, so
+regular runs pay nothing.
+
+The sampler writes a collapsed-stack file (`<script>-<ts>.folded`) that can be
+fed to flamegraph.pl or speedscope. Every stack is rooted at the active
+metrics.stage() and tagged [cpu] or [io] depending on whether the thread
+consumed CPU since the previous sample, so the flamegraph shows per-stage CPU
+vs network/sleep time.
+cProfile writes a `.prof` file (snakeviz, pstats) and prints the top functions.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+import metrics
+
+PROFILE_DIR = Path(os.getenv("SCRIPT_PROFILE_DIR", Path(__file__).parent / "profiles"))
+SAMPLE_INTERVAL = float(os.getenv("SCRIPT_PROFILE_INTERVAL_MS", "5")) / 1000
+
+PROFILERS = ["sample", "cprofile"]
+
+# Innermost frames that mean the thread is waiting, not computing
+# (only used where per-thread CPU clocks are unavailable)
+IO_MODULES = ("socket", "ssl", "selectors", "select", "http/client", "urllib3/connection", "queue", "threading")
+IO_FUNCTIONS = {"sleep", "recv", "recv_into", "read", "readinto", "readline", "connect", "create_connection",
+                "getaddrinfo", "select", "poll", "wait", "acquire", "_wait_for_tstate_lock"}
+
+
+def parse_profile_flag(argv=None):
+    """Remove --profile[=kind] from argv and return the requested profiler (or None)."""
+    argv = sys.argv if argv is None else argv
+    kind = os.getenv("SCRIPT_PROFILE") or None
+    for arg in list(argv[1:]):
+        if arg == "--profile":
+            kind = "sample"
+            argv.remove(arg)
+        elif arg.startswith("--profile="):
+            kind = arg.split("=", 1)[1]
+            argv.remove(arg)
+    if kind and kind not in PROFILERS:
+        raise ValueError(f"Unknown profiler '{kind}', expected one of {PROFILERS}")
+    return kind
+
+
+def run(main, name=None):
+    """Run a script's main(), under a profiler when --profile is given."""
+    kind = parse_profile_flag()
+    if not kind:
+        return main()
+
+    name = name or Path(sys.argv[0]).stem
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+
+    if kind == "cprofile":
+        return _run_cprofile(main, PROFILE_DIR / f"{name}-{stamp}.prof")
+    return _run_sampled(main, PROFILE_DIR / f"{name}-{stamp}.folded")
+
+
+def _run_cprofile(main, path):
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(main)
+    finally:
+        profiler.dump_stats(str(path))
+        print(f"\n🔬 cProfile written to {path}")
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+
+
+def _frame_label(code):
+    return f"{Path(code.co_filename).stem}:{code.co_name}"
+
+
+def _is_io_frame(code):
+    filename = code.co_filename.replace("\\", "/")
+    return code.co_name in IO_FUNCTIONS and any(m in filename for m in IO_MODULES)
+
+
+class Sampler(threading.Thread):
+    """Periodically sample one thread's Python stack into collapsed-stack counts."""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        super().__init__(name="profiling-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.kinds = Counter()
+        self._stop_event = threading.Event()
+        try:
+            self.clock_id = time.pthread_getcpuclockid(thread_id)
+        except (AttributeError, OSError):
+            self.clock_id = None
+
+    def _sample_kind(self, frame, last_cpu):
+        if self.clock_id is None:
+            return ("io" if _is_io_frame(frame.f_code) else "cpu"), None
+        cpu = time.clock_gettime(self.clock_id)
+        busy = last_cpu is not None and cpu - last_cpu >= self.interval / 2
+        return ("cpu" if busy else "io"), cpu
+
+    def run(self):
+        last_cpu = time.clock_gettime(self.clock_id) if self.clock_id is not None else None
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            kind, last_cpu = self._sample_kind(frame, last_cpu)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            stage = metrics.current_stage(self.thread_id) or "-"
+            stack.append(f"stage:{stage}")
+            stack.reverse()
+            stack.append(f"[{kind}]")
+            self.stacks[";".join(stack)] += 1
+            self.kinds[(stage, kind)] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _run_sampled(main, path):
+    sampler = Sampler(threading.get_ident())
+    sampler.start()
+    try:
+        return main()
+    finally:
+        sampler.stop()
+        with open(path, "w") as f:
+            for stack, count in sampler.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        print(f"\n🔬 Collapsed stacks written to {path} ({sum(sampler.stacks.values())} samples)")
+        _print_stage_split(sampler)
+
+
+def _print_stage_split(sampler):
+    stages = sorted({stage for stage, _ in sampler.kinds})
+    total = sum(sampler.kinds.values()) or 1
+    print(f"{'stage':20} {'samples':>8} {'cpu':>7} {'io':>7}")
+    for stage in stages:
+        cpu = sampler.kinds[(stage, "cpu")]
+        io = sampler.kinds[(stage, "io")]
+        print(f"{stage:20} {cpu + io:8} {cpu * 100 / total:6.1f}% {io * 100 / total:6.1f}%")
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Shared rate limits for OpenAI and RapidAPI, across threads and processes.
+
+Each script used to sleep a fixed 0.1-1.5 s between calls, whatever else was
+running: three classifiers plus a worker went over the quota together and
+all got 429 storms. Calls now draw from token buckets kept in a local SQLite
+file (WAL, scripts/cache/ratelimit.sqlite), one per provider, API key and
+dimension (requests and tokens per minute). Every process on the machine
+shares them, so together they run at the quota instead of each at its own
+guess.
+
+Buckets refill continuously at RATELIMIT_HEADROOM (90%) of the provider's
+limit and hold RATELIMIT_BURST_SECONDS of it. A call takes its share up
+front and the bucket may go negative: the caller then sleeps until its share
+would have refilled, so waiting callers are served in order without polling.
+Chat calls are charged an estimate (prompt + expected output) and settled to
+`usage` afterwards. A 429 empties the buckets for its retry-after, which makes
+every process back off, not only the one that got it.
+
+    response = ratelimit.call("openai_embeddings", lambda: session.post(...),
+                              tokens_n=n, key=OPENAI_API_KEY)
+
+Limits: RATELIMIT_<PROVIDER>_RPM / _TPM (0 = unlimited), e.g.
+RATELIMIT_OPENAI_CHAT_TPM=30000. Bypass with --no-ratelimit or RATELIMIT=0.
+
+    python ratelimit.py status | reset
+    python ratelimit.py simulate --processes=4 --rpm=240 --seconds=10
+"""
+
+import os
+import sys
+import hashlib
+import json
+import multiprocessing
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import breaker
+import metrics
+import profiling
+import tokens
+
+STORE_PATH = Path(os.getenv("RATELIMIT_PATH", Path(__file__).parent / "cache" / "ratelimit.sqlite"))
+BYPASS = os.getenv("RATELIMIT", "1") == "0" or "--no-ratelimit" in sys.argv
+
+HEADROOM = float(os.getenv("RATELIMIT_HEADROOM", "0.9"))
+BURST_SECONDS = float(os.getenv("RATELIMIT_BURST_SECONDS", "10"))
+# Back-off after a 429 that says nothing about when to retry
+PAUSE_SECONDS = float(os.getenv("RATELIMIT_PAUSE_SECONDS", "5"))
+# Completion tokens charged up front when the request sets no maximum
+CHAT_OUTPUT_ESTIMATE = 500
+
+# provider: (requests per minute, tokens per minute); the old sleeps allowed ~40 RapidAPI calls a minute
+DEFAULT_LIMITS = {
+    "openai_chat": (500, 200000),
+    "openai_embeddings": (3000, 1000000),
+    "rapidapi": (40, 0),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    name TEXT PRIMARY KEY,
+    level REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+_local = threading.local()
+
+
+def limits(provider):
+    """(rpm, tpm) for a provider, from RATELIMIT_<PROVIDER>_RPM / _TPM or the defaults."""
+    rpm, tpm = DEFAULT_LIMITS.get(provider, (0, 0))
+    prefix = f"RATELIMIT_{provider.upper()}"
+    return int(os.getenv(f"{prefix}_RPM", rpm)), int(os.getenv(f"{prefix}_TPM", tpm))
+
+
+def _connect():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        STORE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(STORE_PATH, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def bucket_names(provider, key=None):
+    """{"requests": name, "tokens": name}; keys are stored as a short hash, never in clear."""
+    key_id = hashlib.sha256((key or "").encode("utf-8")).hexdigest()[:12]
+    return {dim: f"{provider}:{key_id}:{dim}" for dim in ("requests", "tokens")}
+
+
+def _update(amounts, pause_seconds=None, now=None):
+    """Take amounts {(bucket name, per-minute limit): units} from the buckets in one transaction.
+
+    Negative amounts give units back; pause_seconds leaves every bucket at least
+    that many seconds of refill below zero. Returns the seconds until the most
+    indebted bucket is back to zero.
+    """
+    now = time.time() if now is None else now
+    conn = _connect()
+    wait = 0.0
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for (name, limit), amount in amounts.items():
+            rate = limit * HEADROOM / 60
+            capacity = rate * BURST_SECONDS
+            row = conn.execute("SELECT level, updated_at FROM buckets WHERE name = ?", (name,)).fetchone()
+            level = capacity if row is None else min(capacity, row[0] + max(now - row[1], 0) * rate)
+            level -= amount
+            if pause_seconds is not None:
+                level = min(level, -rate * pause_seconds)
+            conn.execute("INSERT OR REPLACE INTO buckets (name, level, updated_at) VALUES (?, ?, ?)",
+                         (name, level, now))
+            if level < 0:
+                wait = max(wait, -level / rate)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return wait
+
+
+def _amounts(provider, key, requests_n, tokens_n):
+    rpm, tpm = limits(provider)
+    names = bucket_names(provider, key)
+    amounts = {}
+    if rpm and requests_n:
+        amounts[(names["requests"], rpm)] = requests_n
+    if tpm and tokens_n:
+        amounts[(names["tokens"], tpm)] = tokens_n
+    return amounts
+
+
+def acquire(provider, tokens_n=0, key=None):
+    """Take one request and tokens_n tokens from the provider's buckets, sleeping if they run short."""
+    amounts = _amounts(provider, key, 1, tokens_n)
+    if not amounts:
+        return
+    wait = _update(amounts)
+    if wait > 0:
+        metrics.incr(f"ratelimit_waits.{provider}")
+        metrics.observe("ratelimit_wait_seconds", wait)
+        time.sleep(wait)
+
+
+def settle(provider, reserved, used, key=None, sent=True):
+    """Correct a call's charge once its real token count is known (or refund it if it was not sent)."""
+    amounts = _amounts(provider, key, 0 if sent else -1, used - reserved)
+    if amounts:
+        _update(amounts)
+
+
+def pause(provider, seconds, key=None):
+    """Empty the provider's buckets so that no process calls it for `seconds`."""
+    # Not cumulative: processes hitting the same 429 all pause until the same moment
+    amounts = {bucket: 0 for bucket in _amounts(provider, key, 1, 1)}
+    if amounts:
+        _update(amounts, pause_seconds=seconds)
+    metrics.incr(f"ratelimit_pauses.{provider}")
+
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def retry_after(response):
+    """Seconds to wait after a 429: retry-after, or OpenAI's x-ratelimit-reset-* ("6m0s", "20ms")."""
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers["retry-after"])
+    except (KeyError, ValueError):
+        pass
+    resets = []
+    for header in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+        parts = _DURATION.findall(headers.get(header) or "")
+        if parts:
+            resets.append(sum(float(n) * _UNITS[unit] for n, unit in parts))
+    return max(resets) if resets else PAUSE_SECONDS
+
+
+def chat_tokens(data):
+    """Tokens an OpenAI chat / responses request is charged up front: prompt + maximum output."""
+    prompt = data.get("messages") or data.get("input") or ""
+    text = prompt if isinstance(prompt, str) else json.dumps(prompt, ensure_ascii=False)
+    output = (data.get("max_completion_tokens") or data.get("max_tokens")
+              or data.get("max_output_tokens") or CHAT_OUTPUT_ESTIMATE)
+    return tokens.count_tokens(text, data.get("model") or tokens.CHAT_MODEL) + output
+
+
+def call(provider, send, tokens_n=0, key=None, settle_usage=False):
+    """send() -> requests.Response within the provider's limits.
+
+    settle_usage: read `usage.total_tokens` from a 200 response to correct the
+    up-front charge (chat responses; embedding counts are exact already).
+    """
+    if BYPASS:
+        return send()
+    acquire(provider, tokens_n, key)
+    try:
+        response = send()
+    except breaker.CircuitOpen:
+        # Nothing went out
+        settle(provider, tokens_n, 0, key, sent=False)
+        raise
+    if response.status_code == 429:
+        seconds = retry_after(response)
+        print(f"  ⏳ {provider}: 429, every process pauses {seconds:.1f}s")
+        pause(provider, seconds, key)
+        metrics.retry(f"ratelimit_429.{provider}")
+    elif settle_usage and response.status_code == 200:
+        try:
+            used = (response.json().get("usage") or {}).get("total_tokens")
+        except ValueError:
+            used = None
+        if used is not None:
+            settle(provider, tokens_n, used, key)
+    return response
+
+
+def status():
+    now = time.time()
+    rows = _connect().execute("SELECT name, level, updated_at FROM buckets ORDER BY name").fetchall()
+    result = []
+    for name, level, updated_at in rows:
+        provider, _, dim = name.split(":")
+        rpm, tpm = limits(provider)
+        limit = rpm if dim == "requests" else tpm
+        if limit:
+            rate = limit * HEADROOM / 60
+            level = min(rate * BURST_SECONDS, level + (now - updated_at) * rate)
+        result.append((name, level, limit))
+    return result
+
+
+def _simulate_worker(provider, deadline, counter):
+    while time.time() < deadline:
+        acquire(provider)
+        if time.time() < deadline:
+            with counter.get_lock():
+                counter.value += 1
+
+
+def simulate(processes=4, rpm=240, seconds=10.0):
+    """Several processes calling as fast as they can on one bucket: the total rate stays at the limit."""
+    provider = f"simulate_{os.getpid()}"
+    os.environ[f"RATELIMIT_{provider.upper()}_RPM"] = str(rpm)
+    os.environ[f"RATELIMIT_{provider.upper()}_TPM"] = "0"
+    counter = multiprocessing.Value("i", 0)
+    deadline = time.time() + seconds
+    workers = [multiprocessing.Process(target=_simulate_worker, args=(provider, deadline, counter))
+               for _ in range(processes)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    with _connect() as conn:
+        conn.execute("DELETE FROM buckets WHERE name LIKE ?", (f"{provider}:%",))
+    # A full bucket at the start is the allowed burst
+    allowed = rpm * HEADROOM / 60 * (seconds + BURST_SECONDS)
+    print(f"  {processes} processes, {seconds:.0f}s at {rpm} rpm: {counter.value} calls "
+          f"(allowed {allowed:.0f} with a {BURST_SECONDS:.0f}s burst and {HEADROOM:.0%} headroom)")
+    return counter.value, allowed
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if command == "reset":
+        with _connect() as conn:
+            conn.execute("DELETE FROM buckets")
+        print(f"🧹 Cleared {STORE_PATH}")
+    elif command == "simulate":
+        opts = dict(a[2:].split("=", 1) for a in sys.argv[2:] if a.startswith("--") and "=" in a)
+        simulate(int(opts.get("processes", 4)), int(opts.get("rpm", 240)), float(opts.get("seconds", 10)))
+    else:
+        print(f"🚦 {STORE_PATH}")
+        for name, level, limit in status():
+            print(f"  {name:48} {level:12.0f} available  (limit {limit}/min)")
+
+
+if __name__ == "__main__":
+    profiling.run(main)
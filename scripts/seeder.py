@@ -4,18 +4,17 @@ LinkedIn Content Factory - Database Seeder
 Populates viral_posts_bank with LinkedIn posts for RAG.
 """
 
+from __future__ import annotations
+
 import os
 import sys
 import json
 import requests
 from typing import Optional
 
-try:
-    from supabase import create_client, Client
-    from openai import OpenAI
-except ImportError:
-    print("Please install dependencies: pip install supabase openai requests")
-    sys.exit(1)
+import metrics
+import profiling
+import tokens
 
 # Configuration
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
@@ -39,6 +38,13 @@ def validate_env():
 
 def create_clients():
     """Initialize Supabase and OpenAI clients."""
+    # Imported here: the module itself loads without supabase / openai installed
+    try:
+        from supabase import create_client, Client
+        from openai import OpenAI
+    except ImportError:
+        print("Please install dependencies: pip install supabase openai requests")
+        sys.exit(1)
     supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
     openai_client = OpenAI(api_key=OPENAI_KEY)
     return supabase, openai_client
@@ -64,8 +70,8 @@ def fetch_linkedin_posts_unipile(account_id: str) -> list:
 def vectorize_text(openai_client, text: str) -> list:
     """Generate embedding for text using OpenAI."""
     response = openai_client.embeddings.create(
-        input=text[:8000],  # Limit to avoid token limits
-        model="text-embedding-3-small"
+        input=tokens.truncate(text, tokens.EMBEDDING_MAX_TOKENS),
+        model=tokens.EMBEDDING_MODEL
     )
     return response.data[0].embedding
 
@@ -126,7 +132,8 @@ def seed_sample_data(supabase: Client, openai_client):
         print(f"  [{i}/{len(sample_posts)}] Vectorizing: {content[:40]}...")
         
         try:
-            embedding = vectorize_text(openai_client, content)
+            with metrics.stage("embed"):
+                embedding = vectorize_text(openai_client, content)
             
             data = {
                 "content": content,
@@ -135,7 +142,9 @@ def seed_sample_data(supabase: Client, openai_client):
                 "embedding": embedding
             }
             
-            supabase.table("viral_posts_bank").insert(data).execute()
+            with metrics.stage("write"):
+                supabase.table("viral_posts_bank").insert(data).execute()
+            metrics.incr("items_processed")
             print(f"  ✅ Inserted post {i}")
             
         except Exception as e:
@@ -219,6 +228,7 @@ def main():
     print("=" * 50)
     
     validate_env()
+    metrics.start_run("seeder")
     supabase, openai_client = create_clients()
     
     print("\n📦 Starting database seeding...\n")
@@ -242,4 +252,4 @@ def main():
     print("  3. Start the dev server: npm run dev")
 
 if __name__ == "__main__":
-    main()
+    profiling.run(main)
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Zero-copy multi-process scoring against a label matrix.
+
+A process pool that gets its inputs as arguments pickles the label matrix
+into every worker and each post-embedding batch into every task. Here both
+live in multiprocessing.shared_memory segments instead, seen as NumPy views
+on both sides:
+
+    labels  (n_labels, d) float32, unit rows, written once
+    blocks  (2, SHARED_BLOCK_ROWS, d) float32, double-buffered post embeddings
+
+Workers attach to the segments once (pool initializer). A task is just
+(slot, start, stop); it returns the best label index and score of each row.
+Batches larger than a block are cut into blocks that alternate between the
+two slots, so the parent fills the next block while the previous one is
+being scored. The parent keeps the label ids and owns (unlinks) the segments.
+
+    with shared_labels.LabelStore(TOPIC_CACHE, processes=4) as store:
+        best = store.best(embeddings)   # [(label_id, score), ...]
+
+When it helps: every pooled block costs a copy into shared memory plus a
+round trip per worker (~2 ms, plus ~4 ms per 1000 x 1536 rows copied), while
+scoring costs ~rows x labels x dims. Measured on 1536 dims, the pool only
+wins from about SHARED_MIN_WORK = rows x labels = 500k with 4+ cores (4096
+rows x 100+ labels, 1000 rows x 500 labels). Smaller inputs (a classify
+batch is 100 posts x ~10 labels) are scored in the calling process against
+the same shared label matrix, so --processes never makes them slower.
+
+Benchmark (single process vs pool):
+    python shared_labels.py --synthetic 200000 [--labels=500] [--processes=4]
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import metrics
+import profiling
+import quantize
+
+BLOCK_ROWS = int(os.getenv("SHARED_BLOCK_ROWS", "4096"))
+# rows x labels below which scoring stays in the calling process
+MIN_WORK = int(os.getenv("SHARED_MIN_WORK", "500000"))
+SLOTS = 2
+
+
+class SharedArray:
+    """A NumPy array backed by a named shared memory segment (created, or attached with spec)."""
+
+    def __init__(self, shape, dtype=np.float32, name=None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        size = max(int(np.prod(self.shape)) * self.dtype.itemsize, 1)
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+
+    @property
+    def spec(self):
+        """Picklable (name, shape, dtype) to attach from another process."""
+        return self.shm.name, self.shape, self.dtype.str
+
+    @classmethod
+    def attach(cls, spec):
+        name, shape, dtype = spec
+        return cls(shape, dtype, name=name)
+
+    def close(self):
+        self.array = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# Worker side: views attached once by the pool initializer
+_LABELS = None
+_BLOCKS = None
+
+
+def _attach(label_spec, block_spec):
+    global _LABELS, _BLOCKS
+    _LABELS = SharedArray.attach(label_spec)
+    _BLOCKS = SharedArray.attach(block_spec)
+
+
+def _score(slot, start, stop):
+    """Best label index and cosine score for rows [start, stop) of a block."""
+    block = _BLOCKS.array[slot, start:stop]
+    return best_rows(block, _LABELS.array)
+
+
+def best_rows(block, labels):
+    """(best label index, cosine score) of each row against unit-norm label rows."""
+    sims = block @ labels.T
+    best = sims.argmax(axis=1)
+    norms = np.linalg.norm(block, axis=1)
+    scores = sims[np.arange(len(best)), best] / np.where(norms > 0, norms, 1)
+    return best.astype(np.int32), scores.astype(np.float32)
+
+
+class LabelStore:
+    """Label matrix + double-buffered embedding blocks in shared memory, scored by a process pool."""
+
+    def __init__(self, cache, processes=None, block_rows=BLOCK_ROWS, min_work=MIN_WORK):
+        """cache: {label_id: {"embedding": vector, ...}} (the classify_posts_batch caches)."""
+        self.ids = list(cache)
+        matrix = np.vstack([np.asarray(cache[i]["embedding"], dtype=np.float32) for i in self.ids])
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self.dim = matrix.shape[1]
+        self.processes = processes or os.cpu_count() or 1
+        self.block_rows = block_rows
+        self.min_work = min_work
+
+        self.labels = SharedArray(matrix.shape)
+        self.labels.array[:] = matrix / np.where(norms > 0, norms, 1)
+        self.blocks = SharedArray((SLOTS, block_rows, self.dim))
+        self.pool = ProcessPoolExecutor(self.processes, initializer=_attach,
+                                        initargs=(self.labels.spec, self.blocks.spec))
+        # Futures still reading each slot; the slot is not refilled before they finish
+        self.in_flight = [[] for _ in range(SLOTS)]
+        self.next_slot = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def submit(self, embeddings):
+        """Copy up to block_rows embeddings into the next free slot and fan it out. Returns the futures."""
+        slot = self.next_slot
+        self.next_slot = (slot + 1) % SLOTS
+        for future in self.in_flight[slot]:
+            future.result()
+        n = len(embeddings)
+        self.blocks.array[slot, :n] = embeddings
+        step = -(-n // self.processes)
+        futures = [self.pool.submit(_score, slot, start, min(start + step, n)) for start in range(0, n, step)]
+        self.in_flight[slot] = futures
+        return futures
+
+    def scores(self, embeddings):
+        """(best label index, score) arrays for any number of embeddings."""
+        if not len(embeddings):
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+        if len(embeddings) * len(self.ids) < self.min_work:
+            # Copy and IPC would cost more than the matmul
+            metrics.incr("rows_scored_inline", len(embeddings))
+            return best_rows(np.asarray(embeddings, dtype=np.float32), self.labels.array)
+        pending = [
+            self.submit(embeddings[start:start + self.block_rows])
+            for start in range(0, len(embeddings), self.block_rows)
+        ]
+        parts = [future.result() for futures in pending for future in futures]
+        metrics.incr("rows_scored_shared", len(embeddings))
+        return np.concatenate([b for b, _ in parts]), np.concatenate([s for _, s in parts])
+
+    def best(self, embeddings):
+        """[(label_id, score)] per embedding, like classify_posts_batch.find_best_*."""
+        best, scores = self.scores(embeddings)
+        return [(self.ids[b], float(s)) for b, s in zip(best, scores)]
+
+    def close(self):
+        self.pool.shutdown()
+        self.labels.close()
+        self.blocks.close()
+
+
+def worth_it(rows, n_labels, processes):
+    """Whether a pool of `processes` can beat one process on batches of rows x n_labels."""
+    return processes > 1 and rows * n_labels >= MIN_WORK
+
+
+def benchmark(labels, posts, processes, batch_rows=100):
+    labels = labels.astype(np.float32)
+    posts = posts.astype(np.float32)
+    cache = {i: {"embedding": v} for i, v in enumerate(labels)}
+    unit = labels / np.linalg.norm(labels, axis=1, keepdims=True)
+
+    start = time.perf_counter()
+    single = np.concatenate([best_rows(posts[i:i + BLOCK_ROWS], unit)[0]
+                             for i in range(0, len(posts), BLOCK_ROWS)])
+    single_s = time.perf_counter() - start
+
+    with LabelStore(cache, processes) as store:
+        store.scores(posts[:1])  # pool start-up
+        start = time.perf_counter()
+        shared, _ = store.scores(posts)
+        shared_s = time.perf_counter() - start
+        # classify_posts_batch scores one claimed batch at a time
+        start = time.perf_counter()
+        for i in range(0, len(posts), batch_rows):
+            store.scores(posts[i:i + batch_rows])
+        batches_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(0, len(posts), batch_rows):
+        best_rows(posts[i:i + batch_rows], unit)
+    single_batches_s = time.perf_counter() - start
+
+    print(f"  {len(posts)} posts x {len(labels)} labels ({posts.shape[1]} dims), {os.cpu_count()} cores")
+    print(f"  1 process:   {single_s:7.3f}s  ({single_batches_s:.3f}s in batches of {batch_rows})")
+    print(f"  {processes} processes: {shared_s:7.3f}s  ({batches_s:.3f}s in batches of {batch_rows}, "
+          f"{'pooled' if worth_it(batch_rows, len(labels), processes) else 'inline'})  "
+          f"(agreement {np.mean(single == shared):.4f})")
+
+
+def main():
+    n_posts = 100000
+    n_labels = 200
+    processes = os.cpu_count() or 1
+    for i, arg in enumerate(sys.argv):
+        if arg == "--synthetic" and i + 1 < len(sys.argv):
+            n_posts = int(sys.argv[i + 1])
+        elif arg.startswith("--labels="):
+            n_labels = int(arg.split("=", 1)[1])
+        elif arg.startswith("--processes="):
+            processes = int(arg.split("=", 1)[1])
+
+    print("🧮 Shared-memory scoring benchmark...")
+    labels, posts = quantize.synthetic_data(n_posts, n_labels)
+    benchmark(labels, posts, processes)
+
+
+if __name__ == "__main__":
+    profiling.run(main)
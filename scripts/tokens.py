@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Token-aware budgeting for OpenAI inputs.
+Counts and truncates by real tokens (tiktoken, cached per encoding) instead of
+character slices, and packs embedding batches up to the API limits.
+
+tiktoken is optional: without it (or offline) a conservative estimate is used
+(ASCII text ~3 chars/token, accents/emojis counted per UTF-8 byte pair) so
+requests stay under the limits, at the cost of some unused capacity.
+"""
+
+import math
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+CHAT_MODEL = "gpt-5.2"
+
+# OpenAI embeddings limits
+EMBEDDING_MAX_TOKENS = 8191            # per input
+EMBEDDING_REQUEST_MAX_TOKENS = 300000  # per request, all inputs together
+EMBEDDING_MAX_INPUTS = 2048            # per request
+
+# Encoding per model family; unknown models fall back to o200k_base
+ENCODINGS = {
+    "text-embedding-3-small": "cl100k_base",
+    "text-embedding-3-large": "cl100k_base",
+    "text-embedding-ada-002": "cl100k_base",
+}
+DEFAULT_ENCODING = "o200k_base"
+
+
+@lru_cache(maxsize=None)
+def get_encoder(model=EMBEDDING_MODEL):
+    """Return the (cached) tiktoken encoder for a model, or None without tiktoken."""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(ENCODINGS.get(model, DEFAULT_ENCODING))
+    except Exception as e:
+        # The encoding file is downloaded on first use; stay usable offline
+        print(f"⚠️ tiktoken unavailable ({e.__class__.__name__}), using token estimates")
+        return None
+
+
+def _estimate_tokens(text):
+    ascii_chars = 0
+    other_bytes = 0
+    for ch in text:
+        if ord(ch) < 128:
+            ascii_chars += 1
+        else:
+            other_bytes += len(ch.encode("utf-8"))
+    return math.ceil(ascii_chars / 3) + math.ceil(other_bytes / 2)
+
+
+def count_tokens(text, model=EMBEDDING_MODEL):
+    """Number of tokens in text for the given model."""
+    if not text:
+        return 0
+    encoder = get_encoder(model)
+    if encoder is None:
+        return _estimate_tokens(text)
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def truncate(text, max_tokens, model=EMBEDDING_MODEL):
+    """Cut text to at most max_tokens tokens."""
+    if not text or max_tokens <= 0:
+        return ""
+    encoder = get_encoder(model)
+    if encoder is None:
+        if _estimate_tokens(text) <= max_tokens:
+            return text
+        # Binary search on the character length
+        lo, hi = 0, len(text)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if _estimate_tokens(text[:mid]) <= max_tokens:
+                lo = mid
+            else:
+                hi = mid - 1
+        return text[:lo]
+
+    ids = encoder.encode(text, disallowed_special=())
+    if len(ids) <= max_tokens:
+        return text
+    # Decoding can split a multi-token character; drop the replacement char
+    return encoder.decode(ids[:max_tokens]).rstrip("�")
+
+
+def pack_batches(texts, max_request_tokens=EMBEDDING_REQUEST_MAX_TOKENS,
+                 max_inputs=EMBEDDING_MAX_INPUTS, model=EMBEDDING_MODEL):
+    """Split texts into index batches that each fit in one embeddings request.
+
+    Texts are expected to be truncated to the per-input limit already.
+    Returns a list of lists of indices into texts, in order.
+    """
+    batches = []
+    current = []
+    current_tokens = 0
+    for i, text in enumerate(texts):
+        n = max(1, count_tokens(text, model))
+        if current and (current_tokens + n > max_request_tokens or len(current) >= max_inputs):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(i)
+        current_tokens += n
+    if current:
+        batches.append(current)
+    return batches
+
+
+def fit_texts(texts, budget, max_tokens_each, model=CHAT_MODEL):
+    """Truncate each text to max_tokens_each and keep as many as fit in budget.
+
+    Used to fill an LLM prompt up to its token budget. Texts are taken in
+    order (callers pass them best-first).
+    """
+    selected = []
+    used = 0
+    for text in texts:
+        text = truncate(text or "", max_tokens_each, model)
+        if not text:
+            continue
+        n = count_tokens(text, model)
+        if used + n > budget:
+            remaining = budget - used
+            # Keep a shortened post if at least a quarter of one still fits
+            if remaining >= max_tokens_each // 4:
+                selected.append(truncate(text, remaining, model))
+            break
+        selected.append(text)
+        used += n
+    return selected
+
+
+def split_windows(text, window_tokens, overlap_tokens=0, model=EMBEDDING_MODEL):
+    """Split text into overlapping windows of at most window_tokens tokens.
+
+    Returns a list of (window_text, token_count). Short texts give a single
+    window; empty text gives none.
+    """
+    if not text:
+        return []
+    stride = max(1, window_tokens - overlap_tokens)
+    encoder = get_encoder(model)
+
+    if encoder is None:
+        total = _estimate_tokens(text)
+        if total <= window_tokens:
+            return [(text, total)]
+        # Same windows on the character axis, scaled by this text's chars/token
+        chars_per_token = len(text) / total
+        size = max(1, int(window_tokens * chars_per_token))
+        step = max(1, int(stride * chars_per_token))
+        windows = []
+        for start in range(0, len(text), step):
+            chunk = truncate(text[start:start + size], window_tokens, model)
+            windows.append((chunk, _estimate_tokens(chunk)))
+            if start + size >= len(text):
+                break
+        return windows
+
+    ids = encoder.encode(text, disallowed_special=())
+    if len(ids) <= window_tokens:
+        return [(text, len(ids))]
+    windows = []
+    for start in range(0, len(ids), stride):
+        chunk_ids = ids[start:start + window_tokens]
+        windows.append((encoder.decode(chunk_ids), len(chunk_ids)))
+        if start + window_tokens >= len(ids):
+            break
+    return windows
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Topic discovery: mini-batch k-means over the post embeddings.
+
+Spherical k-means (cosine similarity, unit-norm centroids) trained on random
+mini-batches read from the local snapshot (snapshot.py), so only one batch,
+the centroids and one int32 label per post are ever in memory: 1M posts x 1536
+dims is a 6 GB memmap that is paged in block by block. Then:
+
+  - each cluster is labelled with its most distinctive terms (class-based
+    TF-IDF over a sample of its posts),
+  - clusters are compared to the existing `topics` label embeddings:
+      new topic      cluster no topic is close to (and big enough to matter)
+      merge          topics whose nearest cluster is the same one
+      unmatched      topics no cluster is close to
+
+    python topic_discovery.py --k=40                       # needs python snapshot.py export
+    python topic_discovery.py --k=40 --iterations=300 --batch-size=8192
+    python topic_discovery.py --synthetic 50000 --k=20    # no network, timing only
+"""
+
+import sys
+import re
+import math
+import time
+from collections import Counter
+
+import numpy as np
+
+import metrics
+import profiling
+import quantize
+import snapshot
+import supabase_rest
+from analyze_topics import STOPWORDS
+
+K = 30
+BATCH_SIZE = 4096
+ITERATIONS = 200
+# Stop once centroids move less than this (mean 1 - cosine) for PATIENCE batches
+TOLERANCE = 1e-4
+PATIENCE = 10
+BLOCK_ROWS = 16384
+
+# Cluster <-> topic cosine similarity
+MATCH_THRESHOLD = 0.5
+NEW_TOPIC_THRESHOLD = 0.35
+# Clusters smaller than this share of the corpus are not suggested as topics
+MIN_CLUSTER_SHARE = 0.01
+
+TERMS_SAMPLE = 400
+TOP_TERMS = 8
+
+WORD_RE = re.compile(r"\b[^\W\d_]{4,}\b")
+
+
+class ArraySource:
+    """In-memory embeddings with the snapshot access pattern (for --synthetic)."""
+
+    def __init__(self, matrix):
+        self.matrix = np.asarray(matrix, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.matrix)
+
+    def has_embedding(self):
+        return np.ones(len(self.matrix), dtype=bool)
+
+    def embedding_rows(self, indices):
+        return self.matrix[indices]
+
+    def embedding_blocks(self, block_rows=BLOCK_ROWS):
+        for start in range(0, len(self.matrix), block_rows):
+            yield start, self.matrix[start:start + block_rows]
+
+
+def kmeans_plus_plus(sample, k, rng):
+    """k-means++ seeding on unit vectors (distance = 1 - cosine)."""
+    centers = [sample[rng.integers(len(sample))]]
+    closest = 1 - sample @ centers[0]
+    for _ in range(1, k):
+        weights = np.clip(closest, 0, None) ** 2
+        total = weights.sum()
+        i = rng.choice(len(sample), p=weights / total) if total > 0 else rng.integers(len(sample))
+        centers.append(sample[i])
+        closest = np.minimum(closest, 1 - sample @ sample[i])
+    return np.array(centers, dtype=np.float32)
+
+
+def minibatch_kmeans(source, valid, k=K, batch_size=BATCH_SIZE, iterations=ITERATIONS, seed=0):
+    """Train k unit-norm centroids on random mini-batches of the rows listed in `valid`.
+
+    Each centroid moves towards the mean of its batch points with a learning rate
+    of (points this batch / points seen so far), as in Sculley's web-scale
+    k-means. Centroids that never win a point are re-seeded on the batch points
+    they fit worst. Returns (centroids, iterations run).
+    """
+    rng = np.random.default_rng(seed)
+    k = min(k, len(valid))
+    with metrics.stage("init"):
+        seed_rows = np.unique(rng.choice(valid, min(len(valid), max(20 * k, batch_size)), replace=False))
+        centers = kmeans_plus_plus(quantize.normalize(source.embedding_rows(seed_rows)), k, rng)
+    counts = np.zeros(k, dtype=np.float64)
+
+    calm = 0
+    for iteration in range(1, iterations + 1):
+        with metrics.stage("read"):
+            rows = np.unique(valid[rng.integers(0, len(valid), batch_size)])
+            batch = quantize.normalize(source.embedding_rows(rows))
+        with metrics.stage("train"):
+            sims = batch @ centers.T
+            assign = sims.argmax(axis=1)
+            hits = np.bincount(assign, minlength=k).astype(np.float64)
+            onehot = np.zeros((k, len(batch)), dtype=np.float32)
+            onehot[assign, np.arange(len(batch))] = 1
+            sums = onehot @ batch
+
+            previous = centers.copy()
+            counts += hits
+            won = hits > 0
+            eta = (hits[won] / counts[won])[:, None].astype(np.float32)
+            centers[won] = (1 - eta) * centers[won] + eta * (sums[won] / hits[won, None].astype(np.float32))
+            centers = quantize.normalize(centers)
+
+            # Dead centroids: restart on the points the model currently explains worst
+            dead = np.flatnonzero(counts == 0)
+            if len(dead) and iteration % 10 == 0:
+                worst = np.argsort(sims.max(axis=1))[:len(dead)]
+                centers[dead[:len(worst)]] = batch[worst]
+
+            shift = float(np.mean(1 - np.sum(centers * previous, axis=1)))
+        metrics.observe("centroid_shift", shift)
+        calm = calm + 1 if shift < TOLERANCE else 0
+        if calm >= PATIENCE:
+            break
+    return centers, iteration
+
+
+def assign_all(source, centers, valid_mask):
+    """Nearest centroid (-1 without embedding) and its similarity for every row, block by block."""
+    labels = np.full(len(valid_mask), -1, dtype=np.int32)
+    best = np.zeros(len(valid_mask), dtype=np.float32)
+    for start, block in source.embedding_blocks(BLOCK_ROWS):
+        stop = start + len(block)
+        sims = quantize.normalize(block) @ centers.T
+        mask = valid_mask[start:stop]
+        labels[start:stop][mask] = sims.argmax(axis=1)[mask]
+        best[start:stop][mask] = sims.max(axis=1)[mask]
+    return labels, best
+
+
+def cluster_terms(snap, labels, k, rng, top=TOP_TERMS):
+    """Most distinctive terms per cluster: class-based TF-IDF on a sample of each cluster's posts."""
+    counts = []
+    for c in range(k):
+        members = np.flatnonzero(labels == c)
+        if len(members) > TERMS_SAMPLE:
+            members = np.sort(rng.choice(members, TERMS_SAMPLE, replace=False))
+        words = Counter()
+        for post in snap.take(members, ["content", "hook"]):
+            text = f"{post.get('hook') or ''} {post.get('content') or ''}".lower()
+            words.update(w for w in WORD_RE.findall(text) if w not in STOPWORDS)
+        counts.append(words)
+
+    # weight(t, c) = tf(t, c) * log(1 + average words per cluster / frequency of t across clusters)
+    overall = Counter()
+    for words in counts:
+        overall.update(words)
+    average = sum(overall.values()) / max(k, 1)
+    terms = []
+    for words in counts:
+        total = sum(words.values()) or 1
+        scored = {w: (n / total) * math.log(1 + average / overall[w]) for w, n in words.items() if n > 1}
+        terms.append(sorted(scored, key=scored.get, reverse=True)[:top])
+    return terms
+
+
+def fetch_topics():
+    """Existing topics as (names, unit-norm label matrix)."""
+    rows = supabase_rest.select("topics", {"select": "id,name,embedding", "embedding": "not.is.null"})
+    names = [r["name"] for r in rows]
+    if not rows:
+        return names, np.zeros((0, snapshot.EMBEDDING_DIM), dtype=np.float32)
+    return names, quantize.normalize([quantize.parse_vector(r["embedding"]) for r in rows])
+
+
+def compare_to_topics(centers, sizes, topic_matrix, total):
+    """Suggestions from cluster <-> topic similarities: new topics, merges, unmatched topics."""
+    new, merges, unmatched = [], [], []
+    if len(topic_matrix) == 0:
+        return [c for c in range(len(centers)) if sizes[c] >= MIN_CLUSTER_SHARE * total], [], []
+    sims = centers @ topic_matrix.T
+    for c in range(len(centers)):
+        if sims[c].max() < NEW_TOPIC_THRESHOLD and sizes[c] >= MIN_CLUSTER_SHARE * total:
+            new.append(c)
+    nearest = sims.argmax(axis=0)
+    for c in np.unique(nearest):
+        topics = [t for t in np.flatnonzero(nearest == c) if sims[c, t] >= MATCH_THRESHOLD]
+        if len(topics) > 1:
+            merges.append((int(c), topics))
+    unmatched = [t for t in range(topic_matrix.shape[0]) if sims[:, t].max() < NEW_TOPIC_THRESHOLD]
+    return new, merges, unmatched
+
+
+def main():
+    k, batch_size, iterations = K, BATCH_SIZE, ITERATIONS
+    synthetic = None
+    for i, arg in enumerate(sys.argv):
+        if arg.startswith("--k="):
+            k = int(arg.split("=", 1)[1])
+        elif arg.startswith("--batch-size="):
+            batch_size = int(arg.split("=", 1)[1])
+        elif arg.startswith("--iterations="):
+            iterations = int(arg.split("=", 1)[1])
+        elif arg == "--synthetic" and i + 1 < len(sys.argv):
+            synthetic = int(sys.argv[i + 1])
+
+    metrics.start_run("topic_discovery")
+    if synthetic:
+        print(f"🧪 Synthetic corpus: {synthetic} posts")
+        _, posts = quantize.synthetic_data(synthetic, n_labels=k)
+        source, snap = ArraySource(posts), None
+    else:
+        snap = snapshot.open_snapshot()
+        if not snap.has_embeddings:
+            print("❌ Snapshot has no embeddings, run: python snapshot.py export")
+            return
+        source = snap
+
+    valid_mask = source.has_embedding()
+    if snap is not None:
+        # Near-duplicate copies (dedupe.py) would inflate their cluster
+        valid_mask &= snap.column("duplicate_of") == ""
+    valid = np.flatnonzero(valid_mask)
+    metrics.incr("items_found", len(valid))
+    if len(valid) == 0:
+        print("❌ No post embeddings")
+        return
+    print(f"🔎 Clustering {len(valid)} posts into {k} clusters (batches of {batch_size})...")
+
+    t0 = time.perf_counter()
+    centers, ran = minibatch_kmeans(source, valid, k, batch_size, iterations)
+    with metrics.stage("assign"):
+        labels, best = assign_all(source, centers, valid_mask)
+    elapsed = time.perf_counter() - t0
+    k = len(centers)
+    sizes = np.bincount(labels[labels >= 0], minlength=k)
+    cohesion = np.bincount(labels[labels >= 0], weights=best[labels >= 0], minlength=k) / np.maximum(sizes, 1)
+    metrics.incr("items_processed", len(valid))
+    print(f"✅ {ran} batches + assignment in {elapsed:.1f}s, mean similarity to centroid {best[valid].mean():.3f}\n")
+
+    terms = [[] for _ in range(k)]
+    if snap is not None:
+        with metrics.stage("terms"):
+            terms = cluster_terms(snap, labels, k, np.random.default_rng(0))
+
+    with metrics.stage("fetch"):
+        topic_names, topic_matrix = ([], np.zeros((0, centers.shape[1]), dtype=np.float32)) if synthetic else fetch_topics()
+    nearest = (centers @ topic_matrix.T) if len(topic_names) else None
+
+    print("=" * 60)
+    print("🧩 CLUSTERS")
+    print("=" * 60)
+    for c in np.argsort(-sizes):
+        closest = ""
+        if nearest is not None:
+            t = int(nearest[c].argmax())
+            closest = f" ~ {topic_names[t]} ({nearest[c, t]:.2f})"
+        print(f"#{c:<3} {sizes[c]:7} posts ({100 * sizes[c] / len(valid):4.1f}%) "
+              f"cohesion {cohesion[c]:.2f}{closest}")
+        if terms[c]:
+            print(f"      {', '.join(terms[c])}")
+
+    new, merges, unmatched = compare_to_topics(centers, sizes, topic_matrix, len(valid))
+    print("\n" + "=" * 60)
+    print("💡 SUGGESTIONS")
+    print("=" * 60)
+    for c in new:
+        print(f"➕ New topic from cluster #{c} ({sizes[c]} posts): {', '.join(terms[c]) or '-'}")
+    for c, topics in merges:
+        print(f"🔗 Merge {', '.join(topic_names[t] for t in topics)} (all closest to cluster #{c})")
+    for t in unmatched:
+        print(f"❔ Topic '{topic_names[t]}' matches no cluster")
+    if not (new or merges or unmatched):
+        print("Existing topics cover the clusters.")
+
+
+if __name__ == "__main__":
+    profiling.run(main)
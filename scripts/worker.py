@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Resident worker draining the needs_* flags of viral_posts_bank.
+
+The one-shot scripts pay interpreter start, NumPy import, label download and
+TLS setup on every run. This process pays them once: label vectors stay in
+memory (refreshed every WORKER_LABEL_REFRESH_SECONDS), HTTP connections stay
+open, and flagged rows are claimed in micro-batches (claim_flagged_posts, see
+leases.py) as soon as they show up.
+
+Wake-up: with DATABASE_URL set and psycopg installed, the worker LISTENs on
+viral_posts_flagged (trigger from 20260206_worker_flag_claims.sql) and only
+polls as a safety net. Otherwise it polls, backing off while idle.
+
+    python worker.py                                    # every flag, 1 thread each
+    python worker.py --concurrency=embedding:2,topic:2 --batch-size=50
+    python worker.py --flags=topic,audience --once      # drain and exit
+"""
+
+import os
+import sys
+import json
+import signal
+import threading
+import time
+
+import requests
+
+import breaker
+import classify_posts_batch as cpb
+import dimensions
+import leases
+import llm_cache
+import metrics
+import pg_bulk
+import profiling
+import supabase_rest
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+BATCH_SIZE = int(os.getenv("WORKER_BATCH_SIZE", "50"))
+POLL_SECONDS = float(os.getenv("WORKER_POLL_SECONDS", "2"))
+MAX_POLL_SECONDS = float(os.getenv("WORKER_MAX_POLL_SECONDS", "30"))
+LABEL_REFRESH_SECONDS = int(os.getenv("WORKER_LABEL_REFRESH_SECONDS", "900"))
+REPORT_SECONDS = int(os.getenv("WORKER_REPORT_SECONDS", "300"))
+# e.g. "embedding:2,topic:2" (flags not listed get 1 thread)
+CONCURRENCY = os.getenv("WORKER_CONCURRENCY", "")
+
+NOTIFY_CHANNEL = "viral_posts_flagged"
+
+# Short name -> flag column, classification mode and target column
+FLAGS = {
+    "embedding": {"column": "needs_embedding", "mode": None, "target": "embedding"},
+    "hook": {"column": "needs_hook_classification", "mode": "hook", "target": "hook_type_id"},
+    "topic": {"column": "needs_topic_classification", "mode": "topic", "target": "topic_id"},
+    "audience": {"column": "needs_audience_classification", "mode": "audience", "target": "audience_id"},
+}
+
+STOP = threading.Event()
+LISTENING = threading.Event()
+WAKE = {flag: threading.Event() for flag in FLAGS}
+
+# Held while scoring and while label caches are refreshed
+_labels_lock = threading.Lock()
+
+
+def parse_concurrency(value, flags):
+    """'embedding:2,topic:1' -> {flag: threads} for the selected flags."""
+    concurrency = {flag: 1 for flag in flags}
+    for part in filter(None, value.split(",")):
+        flag, _, n = part.partition(":")
+        if flag not in FLAGS:
+            raise ValueError(f"Unknown flag '{flag}', expected one of {list(FLAGS)}")
+        if flag in concurrency:
+            concurrency[flag] = int(n or 1)
+    return concurrency
+
+
+def load_labels(modes):
+    """(Re)load label embeddings for each mode, reduced to the post embedding size."""
+    with _labels_lock:
+        for mode in modes:
+            cfg = cpb.MODE_CONFIG[mode]
+            cache = cfg["cache"]
+            previous = dict(cache)
+            cache.clear()
+            try:
+                loaded = cfg["fetch"]()
+            except requests.RequestException:
+                loaded = False
+            if not loaded:
+                # Keep serving with the labels we already had
+                cache.update(previous)
+                print(f"⚠️ Could not refresh {mode} labels, keeping {len(cache)}")
+                continue
+            for entry in cache.values():
+                entry["embedding"] = dimensions.reduce(entry["embedding"], cpb.DIMENSIONS)
+            print(f"✅ Loaded {len(cache)} {mode} labels ({cpb.DIMENSIONS} dims)")
+
+
+def _patch_rows(rows):
+    """Write {"id": ..., column: value} rows; returns the ids written."""
+    if pg_bulk.available():
+        # One COPY + UPDATE ... FROM instead of a PATCH per post
+        return pg_bulk.update_rows("viral_posts_bank", rows)
+    # One PATCH per post, sent concurrently
+    results = supabase_rest.gather([
+        ("patch", "viral_posts_bank", {"id": f"eq.{row['id']}"}, {k: v for k, v in row.items() if k != "id"})
+        for row in rows
+    ], return_exceptions=True)
+    return [row["id"] for row, ok in zip(rows, results) if ok is True]
+
+
+def _split(written, dropped):
+    """ids written -> (done, dropped): rows with a result, rows whose flag was only cleared."""
+    dropped = set(dropped)
+    return [i for i in written if i not in dropped], [i for i in written if i in dropped]
+
+
+def process_embeddings(posts):
+    """Store the full-size post embedding (hook + content). Returns (ids done, ids dropped)."""
+    texts = [f"{post.get('hook') or ''}\n\n{post.get('content') or ''}".strip() for post in posts]
+    with metrics.stage("embed"):
+        # viral_posts_bank.embedding is vector(1536), whatever EMBEDDING_DIMENSIONS says
+        embeddings = cpb.generate_embeddings_batch(texts, dims=dimensions.FULL_DIMENSIONS)
+
+    rows = []
+    dropped = []
+    for post, text, embedding in zip(posts, texts, embeddings):
+        if not text:
+            # Nothing to embed: clear the flag instead of claiming the row forever
+            rows.append({"id": post["id"], "needs_embedding": False, "embedding_locked_at": None})
+            dropped.append(post["id"])
+        elif embedding is not None:
+            rows.append({
+                "id": post["id"],
+                "embedding": json.dumps(embedding.tolist()),
+                "needs_embedding": False,
+                "embedding_locked_at": None
+            })
+
+    with metrics.stage("write"):
+        return _split(_patch_rows(rows), dropped)
+
+
+def process_classification(flag, posts):
+    """Classify posts for one flag by label similarity. Returns (ids done, ids dropped)."""
+    spec = FLAGS[flag]
+    cfg = cpb.MODE_CONFIG[spec["mode"]]
+    texts = cpb.post_texts(posts, cfg["use_hook_only"])
+    with metrics.stage("embed"):
+        embeddings = cpb.generate_embeddings_batch(texts)
+
+    rows = []
+    dropped = []
+    with metrics.stage("score"), _labels_lock:
+        labels_loaded = bool(cfg["cache"])
+        for post, text, embedding in zip(posts, texts, embeddings):
+            if not llm_cache.normalize(text or ""):
+                # Nothing to classify (no hook / content): retrying cannot help, clear the flag
+                rows.append({"id": post["id"], spec["column"]: False})
+                dropped.append(post["id"])
+                continue
+            if embedding is None:
+                # Embedding call failed: the row is retried once its lease expires
+                continue
+            type_id, score = cfg["find_best"](embedding)
+            if type_id:
+                rows.append({"id": post["id"], spec["target"]: type_id, spec["column"]: False})
+                metrics.observe("similarity", float(score))
+            elif labels_loaded:
+                # No label scores at all (zero vector): the same answer every time
+                rows.append({"id": post["id"], spec["column"]: False})
+                dropped.append(post["id"])
+
+    with metrics.stage("write"):
+        return _split(_patch_rows(rows), dropped)
+
+
+def work(flag, batch_size, once=False):
+    """Claim and process micro-batches for one flag until stopped."""
+    column = FLAGS[flag]["column"]
+    mode = FLAGS[flag]["mode"]
+    # Hook classification never reads the content: leave it on the server
+    content_chars = cpb.MODE_CONFIG[mode]["content_chars"] if mode else None
+    idle = POLL_SECONDS
+    while not STOP.is_set():
+        # Every flag needs embeddings: do not claim rows while OpenAI is unreachable
+        breaker.get("openai_embeddings").wait(STOP)
+        try:
+            with metrics.stage("fetch"):
+                posts = leases.claim_flagged(column, batch_size, content_chars=content_chars)
+        except requests.RequestException as e:
+            print(f"  ❌ {flag}: claim failed: {e}")
+            posts = []
+
+        if not posts:
+            if once:
+                return
+            # Notifications wake us up; polling is only a safety net then
+            timeout = MAX_POLL_SECONDS if LISTENING.is_set() else idle
+            woke = WAKE[flag].wait(timeout)
+            WAKE[flag].clear()
+            idle = POLL_SECONDS if woke else min(idle * 2, MAX_POLL_SECONDS)
+            continue
+
+        idle = POLL_SECONDS
+        metrics.incr("items_found", len(posts))
+        metrics.incr(f"items_found.{flag}", len(posts))
+        ids = [post["id"] for post in posts]
+        with leases.hold(column, ids):
+            try:
+                if flag == "embedding":
+                    done, dropped = process_embeddings(posts)
+                else:
+                    done, dropped = process_classification(flag, posts)
+            except Exception as e:
+                print(f"  ❌ {flag}: batch failed: {e}")
+                done, dropped = [], []
+
+        metrics.incr("items_processed", len(done))
+        metrics.incr(f"items_processed.{flag}", len(done))
+        # Flag cleared without a result: failed for good, not claimed again
+        metrics.incr("items_dropped", len(dropped))
+        metrics.incr(f"items_dropped.{flag}", len(dropped))
+        metrics.incr("items_failed", len(posts) - len(done) - len(dropped))
+        # Failed rows stay leased until expiry, so they are retried later, not in a hot loop
+        leases.release(column, done + dropped)
+        print(f"  ✅ {flag}: {len(done)}/{len(posts)}" + (f" ({len(dropped)} dropped)" if dropped else ""))
+
+
+def listen():
+    """Wake every flag thread on NOTIFY viral_posts_flagged (needs psycopg >= 3.2)."""
+    try:
+        import psycopg
+    except ImportError:
+        print("⚠️ psycopg not installed, polling only")
+        return
+
+    while not STOP.is_set():
+        try:
+            with psycopg.connect(DATABASE_URL, autocommit=True) as conn:
+                conn.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                LISTENING.set()
+                print(f"👂 Listening on {NOTIFY_CHANNEL}")
+                # Rows may have been flagged while we were not listening
+                wake_all()
+                while not STOP.is_set():
+                    for _ in conn.notifies(timeout=1.0, stop_after=1):
+                        metrics.incr("notifications")
+                        wake_all()
+        except psycopg.Error as e:
+            LISTENING.clear()
+            print(f"⚠️ LISTEN connection lost: {e}")
+            STOP.wait(5)
+    LISTENING.clear()
+
+
+def wake_all():
+    for event in WAKE.values():
+        event.set()
+
+
+def stop(signum=None, frame=None):
+    if not STOP.is_set():
+        print("\n🛑 Stopping after the current batches...")
+    STOP.set()
+    wake_all()
+
+
+def main():
+    if not cpb.OPENAI_API_KEY:
+        raise ValueError("OPENAI_API_KEY environment variable is required")
+    flags = list(FLAGS)
+    concurrency = CONCURRENCY
+    batch_size = BATCH_SIZE
+    once = "--once" in sys.argv
+    for arg in sys.argv[1:]:
+        if arg.startswith("--flags="):
+            flags = [f for f in arg.split("=", 1)[1].split(",") if f]
+        elif arg.startswith("--concurrency="):
+            concurrency = arg.split("=", 1)[1]
+        elif arg.startswith("--batch-size="):
+            batch_size = int(arg.split("=", 1)[1])
+    unknown = [f for f in flags if f not in FLAGS]
+    if unknown:
+        print(f"❌ Unknown flags {unknown}, expected some of {list(FLAGS)}")
+        return
+    threads_per_flag = parse_concurrency(concurrency, flags)
+
+    metrics.start_run("worker")
+    print(f"🛠️ Worker {leases.OWNER}: {threads_per_flag}, batches of {batch_size}\n")
+
+    modes = [FLAGS[f]["mode"] for f in flags if FLAGS[f]["mode"]]
+    with metrics.stage("load_labels"):
+        load_labels(modes)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    if DATABASE_URL and not once:
+        threading.Thread(target=listen, name="listen", daemon=True).start()
+
+    threads = []
+    for flag, n in threads_per_flag.items():
+        for i in range(n):
+            thread = threading.Thread(target=work, args=(flag, batch_size, once), name=f"{flag}-{i}")
+            thread.start()
+            threads.append(thread)
+
+    last_refresh = last_report = time.monotonic()
+    try:
+        while any(t.is_alive() for t in threads):
+            if STOP.wait(1):
+                break
+            now = time.monotonic()
+            if modes and now - last_refresh >= LABEL_REFRESH_SECONDS:
+                with metrics.stage("load_labels"):
+                    load_labels(modes)
+                last_refresh = now
+            if now - last_report >= REPORT_SECONDS:
+                metrics.flush()
+                last_report = now
+    finally:
+        STOP.set()
+        wake_all()
+        for thread in threads:
+            thread.join()
+        for flag in flags:
+            leases.release(FLAGS[flag]["column"])
+
+    print("\n🎉 Worker stopped.")
+
+
+if __name__ == "__main__":
+    profiling.run(main)
@@ -0,0 +1,165 @@
+-- ============================================================================
+-- CLASSIFICATION LEASES
+-- Lets several Python classifier processes (classify_posts_batch.py,
+-- classify_posts.py) run in parallel on disjoint batches of viral_posts_bank.
+-- A worker claims rows with a lease (owner + expiry); expired leases are
+-- claimable again, so a crashed worker only delays its rows.
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS viral_post_leases (
+  post_id UUID NOT NULL REFERENCES viral_posts_bank(id) ON DELETE CASCADE,
+  task TEXT NOT NULL,               -- 'topic', 'hook', 'structure', 'audience'
+  owner TEXT NOT NULL,              -- '<hostname>:<pid>:<random>'
+  expires_at TIMESTAMPTZ NOT NULL,
+  claimed_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (post_id, task)
+);
+
+CREATE INDEX IF NOT EXISTS idx_viral_post_leases_owner ON viral_post_leases(owner, task);
+CREATE INDEX IF NOT EXISTS idx_viral_post_leases_expires ON viral_post_leases(expires_at);
+
+-- No policies: leases are only read and written through the SECURITY DEFINER
+-- claim / renew / release functions below, never directly with the anon key
+ALTER TABLE viral_post_leases ENABLE ROW LEVEL SECURITY;
+
+-- ============================================================================
+-- Claim up to p_limit unclassified posts for a task
+-- FOR UPDATE SKIP LOCKED + the lease table keep concurrent claims disjoint
+-- ============================================================================
+CREATE OR REPLACE FUNCTION claim_posts_for_classification(
+  p_task TEXT,
+  p_owner TEXT,
+  p_limit INTEGER DEFAULT 100,
+  p_lease_seconds INTEGER DEFAULT 300
+)
+RETURNS TABLE (id UUID, content TEXT, hook TEXT)
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $$
+BEGIN
+  IF p_task NOT IN ('topic', 'hook', 'structure', 'audience') THEN
+    RAISE EXCEPTION 'Unknown classification task: %', p_task;
+  END IF;
+
+  RETURN QUERY
+  WITH candidates AS (
+    SELECT vpb.id
+    FROM viral_posts_bank vpb
+    WHERE CASE p_task
+        WHEN 'topic' THEN vpb.topic_id IS NULL
+        WHEN 'hook' THEN vpb.hook_type_id IS NULL
+        WHEN 'structure' THEN vpb.structure_id IS NULL
+        WHEN 'audience' THEN vpb.audience_id IS NULL
+      END
+      AND NOT EXISTS (
+        SELECT 1 FROM viral_post_leases l
+        WHERE l.post_id = vpb.id
+          AND l.task = p_task
+          AND l.expires_at > NOW()
+      )
+    ORDER BY vpb.created_at DESC
+    LIMIT p_limit
+    FOR UPDATE OF vpb SKIP LOCKED
+  ),
+  leased AS (
+    INSERT INTO viral_post_leases (post_id, task, owner, expires_at)
+    SELECT c.id, p_task, p_owner, NOW() + make_interval(secs => p_lease_seconds)
+    FROM candidates c
+    ON CONFLICT (post_id, task) DO UPDATE
+      SET owner = EXCLUDED.owner,
+          expires_at = EXCLUDED.expires_at,
+          claimed_at = NOW()
+      WHERE viral_post_leases.expires_at <= NOW()
+    RETURNING viral_post_leases.post_id
+  )
+  SELECT vpb.id, vpb.content, vpb.hook
+  FROM viral_posts_bank vpb
+  JOIN leased ON leased.post_id = vpb.id;
+END;
+$$;
+
+-- ============================================================================
+-- Extend the leases a worker still holds (heartbeat)
+-- ============================================================================
+CREATE OR REPLACE FUNCTION renew_post_leases(
+  p_task TEXT,
+  p_owner TEXT,
+  p_post_ids UUID[],
+  p_lease_seconds INTEGER DEFAULT 300
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $$
+DECLARE
+  renewed_count INTEGER;
+BEGIN
+  UPDATE viral_post_leases
+  SET expires_at = NOW() + make_interval(secs => p_lease_seconds)
+  WHERE task = p_task
+    AND owner = p_owner
+    AND post_id = ANY(p_post_ids);
+
+  GET DIAGNOSTICS renewed_count = ROW_COUNT;
+  RETURN renewed_count;
+END;
+$$;
+
+-- ============================================================================
+-- Release leases (all of an owner's leases for a task when p_post_ids is NULL)
+-- ============================================================================
+CREATE OR REPLACE FUNCTION release_post_leases(
+  p_task TEXT,
+  p_owner TEXT,
+  p_post_ids UUID[] DEFAULT NULL
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $$
+DECLARE
+  released_count INTEGER;
+BEGIN
+  DELETE FROM viral_post_leases
+  WHERE task = p_task
+    AND owner = p_owner
+    AND (p_post_ids IS NULL OR post_id = ANY(p_post_ids));
+
+  GET DIAGNOSTICS released_count = ROW_COUNT;
+  RETURN released_count;
+END;
+$$;
+
+-- ============================================================================
+-- Cleanup: drop expired leases
+-- ============================================================================
+CREATE OR REPLACE FUNCTION release_stale_post_leases()
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $$
+DECLARE
+  released_count INTEGER;
+BEGIN
+  DELETE FROM viral_post_leases WHERE expires_at <= NOW();
+
+  GET DIAGNOSTICS released_count = ROW_COUNT;
+  RETURN released_count;
+END;
+$$;
+
+-- The Python scripts run with the anon key
+GRANT EXECUTE ON FUNCTION claim_posts_for_classification(TEXT, TEXT, INTEGER, INTEGER) TO anon, service_role;
+GRANT EXECUTE ON FUNCTION renew_post_leases(TEXT, TEXT, UUID[], INTEGER) TO anon, service_role;
+GRANT EXECUTE ON FUNCTION release_post_leases(TEXT, TEXT, UUID[]) TO anon, service_role;
+GRANT EXECUTE ON FUNCTION release_stale_post_leases() TO service_role;
+
+COMMENT ON TABLE viral_post_leases IS 'Per-task leases held by Python classifier workers on viral_posts_bank rows';
+COMMENT ON FUNCTION claim_posts_for_classification IS 'Atomically leases up to N unclassified posts for a task (FOR UPDATE SKIP LOCKED)';
+COMMENT ON FUNCTION renew_post_leases IS 'Extends the leases an owner holds on the given posts';
+COMMENT ON FUNCTION release_post_leases IS 'Releases an owner''s leases (all of them for the task when post ids are NULL)';
+COMMENT ON FUNCTION release_stale_post_leases IS 'Cleanup function deleting expired leases';
@@ -0,0 +1,145 @@
+-- ============================================================================
+-- PYTHON WORKER: FLAG CLAIMS + NOTIFICATIONS
+-- scripts/worker.py is a resident process that drains the needs_* flags of
+-- viral_posts_bank. It claims rows through the viral_post_leases table (task =
+-- flag name) and wakes up on a NOTIFY when new flagged rows land.
+-- ============================================================================
+
+-- ============================================================================
+-- Claim up to p_limit rows whose flag is set
+-- Same conditions as the get_posts_needing_* functions
+-- ============================================================================
+CREATE OR REPLACE FUNCTION claim_flagged_posts(
+  p_flag TEXT,
+  p_owner TEXT,
+  p_limit INTEGER DEFAULT 50,
+  p_lease_seconds INTEGER DEFAULT 300
+)
+RETURNS TABLE (id UUID, content TEXT, hook TEXT)
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $$
+BEGIN
+  IF p_flag NOT IN ('needs_embedding', 'needs_hook_classification',
+                    'needs_topic_classification', 'needs_audience_classification') THEN
+    RAISE EXCEPTION 'Unknown flag: %', p_flag;
+  END IF;
+
+  RETURN QUERY
+  WITH candidates AS (
+    SELECT vpb.id
+    FROM viral_posts_bank vpb
+    WHERE CASE p_flag
+        WHEN 'needs_embedding' THEN
+          vpb.needs_embedding = true
+          AND vpb.embedding IS NULL
+          -- Rows locked by the Deno embedding workers
+          AND (vpb.embedding_locked_at IS NULL
+               OR vpb.embedding_locked_at < NOW() - INTERVAL '5 minutes')
+        WHEN 'needs_hook_classification' THEN
+          vpb.needs_hook_classification = true
+          AND vpb.hook_type_id IS NULL
+          AND vpb.hook IS NOT NULL
+          AND vpb.hook != ''
+        WHEN 'needs_topic_classification' THEN
+          vpb.needs_topic_classification = true
+          AND vpb.topic_id IS NULL
+          AND vpb.content IS NOT NULL
+          AND vpb.content != ''
+        WHEN 'needs_audience_classification' THEN
+          vpb.needs_audience_classification = true
+          AND vpb.audience_id IS NULL
+          AND vpb.content IS NOT NULL
+          AND vpb.content != ''
+      END
+      AND NOT EXISTS (
+        SELECT 1 FROM viral_post_leases l
+        WHERE l.post_id = vpb.id
+          AND l.task = p_flag
+          AND l.expires_at > NOW()
+      )
+    ORDER BY vpb.created_at DESC
+    LIMIT p_limit
+    FOR UPDATE OF vpb SKIP LOCKED
+  ),
+  leased AS (
+    INSERT INTO viral_post_leases (post_id, task, owner, expires_at)
+    SELECT c.id, p_flag, p_owner, NOW() + make_interval(secs => p_lease_seconds)
+    FROM candidates c
+    ON CONFLICT (post_id, task) DO UPDATE
+      SET owner = EXCLUDED.owner,
+          expires_at = EXCLUDED.expires_at,
+          claimed_at = NOW()
+      WHERE viral_post_leases.expires_at <= NOW()
+    RETURNING viral_post_leases.post_id
+  )
+  SELECT vpb.id, vpb.content, vpb.hook
+  FROM viral_posts_bank vpb
+  JOIN leased ON leased.post_id = vpb.id;
+
+  -- Keep the Deno embedding workers off the rows we just claimed
+  IF p_flag = 'needs_embedding' THEN
+    UPDATE viral_posts_bank vpb
+    SET embedding_locked_at = NOW()
+    FROM viral_post_leases l
+    WHERE l.post_id = vpb.id
+      AND l.task = p_flag
+      AND l.owner = p_owner
+      AND l.claimed_at = NOW();
+  END IF;
+END;
+$$;
+
+-- ============================================================================
+-- NOTIFY viral_posts_flagged when a statement sets a needs_* flag
+-- Statement-level, so a 500-row scrape insert sends one notification.
+-- Updates only notify when a flag goes from false to true, so the worker's
+-- own writes (flag -> false) do not wake it up again.
+-- ============================================================================
+CREATE OR REPLACE FUNCTION notify_viral_posts_flagged()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    IF EXISTS (
+      SELECT 1 FROM new_rows
+      WHERE needs_embedding OR needs_hook_classification
+         OR needs_topic_classification OR needs_audience_classification
+    ) THEN
+      PERFORM pg_notify('viral_posts_flagged', TG_OP);
+    END IF;
+  ELSIF EXISTS (
+    SELECT 1 FROM new_rows n
+    JOIN old_rows o ON o.id = n.id
+    WHERE (n.needs_embedding AND NOT COALESCE(o.needs_embedding, false))
+       OR (n.needs_hook_classification AND NOT COALESCE(o.needs_hook_classification, false))
+       OR (n.needs_topic_classification AND NOT COALESCE(o.needs_topic_classification, false))
+       OR (n.needs_audience_classification AND NOT COALESCE(o.needs_audience_classification, false))
+  ) THEN
+    PERFORM pg_notify('viral_posts_flagged', TG_OP);
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+-- Transition tables need one trigger per event
+DROP TRIGGER IF EXISTS trigger_viral_posts_flagged_insert ON viral_posts_bank;
+CREATE TRIGGER trigger_viral_posts_flagged_insert
+  AFTER INSERT ON viral_posts_bank
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION notify_viral_posts_flagged();
+
+DROP TRIGGER IF EXISTS trigger_viral_posts_flagged_update ON viral_posts_bank;
+CREATE TRIGGER trigger_viral_posts_flagged_update
+  AFTER UPDATE ON viral_posts_bank
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION notify_viral_posts_flagged();
+
+GRANT EXECUTE ON FUNCTION claim_flagged_posts(TEXT, TEXT, INTEGER, INTEGER) TO anon, service_role;
+
+COMMENT ON FUNCTION claim_flagged_posts IS 'Atomically leases up to N posts whose needs_* flag is set (FOR UPDATE SKIP LOCKED)';
+COMMENT ON FUNCTION notify_viral_posts_flagged IS 'Sends NOTIFY viral_posts_flagged when an insert or update sets a needs_* flag';
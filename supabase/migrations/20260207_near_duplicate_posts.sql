@@ -0,0 +1,150 @@
+-- ============================================================================
+-- NEAR-DUPLICATE POSTS
+-- scripts/dedupe.py finds near-duplicate posts (re-scrapes, reposts, lightly
+-- edited copies) with MinHash + LSH and points every copy at its canonical
+-- row (the oldest one). Copies inherit the canonical's embedding and labels
+-- instead of being embedded and classified again.
+-- ============================================================================
+
+ALTER TABLE viral_posts_bank
+ADD COLUMN IF NOT EXISTS duplicate_of UUID REFERENCES viral_posts_bank(id) ON DELETE SET NULL;
+
+CREATE INDEX IF NOT EXISTS idx_viral_posts_bank_duplicate_of
+  ON viral_posts_bank(duplicate_of)
+  WHERE duplicate_of IS NOT NULL;
+
+-- ============================================================================
+-- Mark posts as copies of a canonical post
+-- Copies get the canonical's embedding / labels (when it has them) and their
+-- needs_* flags cleared, so the embedding and classification workers skip them
+-- ============================================================================
+CREATE OR REPLACE FUNCTION mark_duplicate_posts(
+  p_canonical UUID,
+  p_duplicates UUID[]
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $$
+DECLARE
+  v_count INTEGER;
+BEGIN
+  UPDATE viral_posts_bank copy
+  SET duplicate_of = canonical.id,
+      embedding = COALESCE(copy.embedding, canonical.embedding),
+      topic_id = COALESCE(copy.topic_id, canonical.topic_id),
+      hook_type_id = COALESCE(copy.hook_type_id, canonical.hook_type_id),
+      structure_id = COALESCE(copy.structure_id, canonical.structure_id),
+      audience_id = COALESCE(copy.audience_id, canonical.audience_id),
+      needs_embedding = false,
+      needs_hook_classification = false,
+      needs_topic_classification = false,
+      needs_audience_classification = false
+  FROM viral_posts_bank canonical
+  WHERE canonical.id = p_canonical
+    AND copy.id = ANY(p_duplicates)
+    AND copy.id <> p_canonical;
+
+  GET DIAGNOSTICS v_count = ROW_COUNT;
+
+  -- A former canonical may now be a copy itself: keep chains one level deep
+  UPDATE viral_posts_bank
+  SET duplicate_of = p_canonical
+  WHERE duplicate_of = ANY(p_duplicates);
+
+  RETURN v_count;
+END;
+$$;
+
+-- ============================================================================
+-- Copies follow their canonical: labels / embedding set later on the
+-- canonical are copied to the rows pointing at it
+-- ============================================================================
+CREATE OR REPLACE FUNCTION propagate_to_duplicate_posts()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SET search_path = public, pg_temp
+AS $$
+BEGIN
+  UPDATE viral_posts_bank
+  SET embedding = COALESCE(embedding, NEW.embedding),
+      topic_id = COALESCE(topic_id, NEW.topic_id),
+      hook_type_id = COALESCE(hook_type_id, NEW.hook_type_id),
+      structure_id = COALESCE(structure_id, NEW.structure_id),
+      audience_id = COALESCE(audience_id, NEW.audience_id)
+  WHERE duplicate_of = NEW.id;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trigger_propagate_to_duplicate_posts ON viral_posts_bank;
+CREATE TRIGGER trigger_propagate_to_duplicate_posts
+  AFTER UPDATE OF embedding, topic_id, hook_type_id, structure_id, audience_id ON viral_posts_bank
+  FOR EACH ROW
+  WHEN (NEW.duplicate_of IS NULL)
+  EXECUTE FUNCTION propagate_to_duplicate_posts();
+
+-- ============================================================================
+-- Classification claims skip copies (they get their labels from the canonical)
+-- Same as 20260205_classification_leases.sql plus the duplicate_of filter
+-- ============================================================================
+CREATE OR REPLACE FUNCTION claim_posts_for_classification(
+  p_task TEXT,
+  p_owner TEXT,
+  p_limit INTEGER DEFAULT 100,
+  p_lease_seconds INTEGER DEFAULT 300
+)
+RETURNS TABLE (id UUID, content TEXT, hook TEXT)
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $$
+BEGIN
+  IF p_task NOT IN ('topic', 'hook', 'structure', 'audience') THEN
+    RAISE EXCEPTION 'Unknown classification task: %', p_task;
+  END IF;
+
+  RETURN QUERY
+  WITH candidates AS (
+    SELECT vpb.id
+    FROM viral_posts_bank vpb
+    WHERE CASE p_task
+        WHEN 'topic' THEN vpb.topic_id IS NULL
+        WHEN 'hook' THEN vpb.hook_type_id IS NULL
+        WHEN 'structure' THEN vpb.structure_id IS NULL
+        WHEN 'audience' THEN vpb.audience_id IS NULL
+      END
+      AND vpb.duplicate_of IS NULL
+      AND NOT EXISTS (
+        SELECT 1 FROM viral_post_leases l
+        WHERE l.post_id = vpb.id
+          AND l.task = p_task
+          AND l.expires_at > NOW()
+      )
+    ORDER BY vpb.created_at DESC
+    LIMIT p_limit
+    FOR UPDATE OF vpb SKIP LOCKED
+  ),
+  leased AS (
+    INSERT INTO viral_post_leases (post_id, task, owner, expires_at)
+    SELECT c.id, p_task, p_owner, NOW() + make_interval(secs => p_lease_seconds)
+    FROM candidates c
+    ON CONFLICT (post_id, task) DO UPDATE
+      SET owner = EXCLUDED.owner,
+          expires_at = EXCLUDED.expires_at,
+          claimed_at = NOW()
+      WHERE viral_post_leases.expires_at <= NOW()
+    RETURNING viral_post_leases.post_id
+  )
+  SELECT vpb.id, vpb.content, vpb.hook
+  FROM viral_posts_bank vpb
+  JOIN leased ON leased.post_id = vpb.id;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION mark_duplicate_posts(UUID, UUID[]) TO anon, service_role;
+
+COMMENT ON COLUMN viral_posts_bank.duplicate_of IS 'Canonical post this row is a near-duplicate of (NULL for canonical / unique posts)';
+COMMENT ON FUNCTION mark_duplicate_posts IS 'Points copies at their canonical post, copies its embedding and labels, clears their needs_* flags';
+COMMENT ON FUNCTION propagate_to_duplicate_posts IS 'Copies embedding / labels set on a canonical post to its duplicates';
@@ -0,0 +1,84 @@
+-- ============================================================================
+-- RULE-BASED FALLBACKS TAGGED FOR A LATER LLM PASS
+-- When the OpenAI circuit breaker is open (scripts/breaker.py), classify_posts.py
+-- and classify_hooks.py keep going with their keyword rules instead of waiting
+-- on timeouts. Rows classified that way are flagged, and
+-- `classify_posts.py --reclassify` / `classify_hooks.py --reclassify` run them
+-- through the LLM again once it is back.
+-- ============================================================================
+
+ALTER TABLE viral_posts_bank
+ADD COLUMN IF NOT EXISTS needs_llm_classification BOOLEAN NOT NULL DEFAULT false;
+
+CREATE INDEX IF NOT EXISTS idx_viral_posts_bank_needs_llm_classification
+  ON viral_posts_bank(created_at DESC)
+  WHERE needs_llm_classification;
+
+ALTER TABLE generated_hooks
+ADD COLUMN IF NOT EXISTS needs_llm_classification BOOLEAN NOT NULL DEFAULT false;
+
+CREATE INDEX IF NOT EXISTS idx_generated_hooks_needs_llm_classification
+  ON generated_hooks(id)
+  WHERE needs_llm_classification;
+
+-- ============================================================================
+-- 'reclassify' claims: posts whose labels came from the rules
+-- Same as 20260207_near_duplicate_posts.sql plus the 'reclassify' task
+-- ============================================================================
+CREATE OR REPLACE FUNCTION claim_posts_for_classification(
+  p_task TEXT,
+  p_owner TEXT,
+  p_limit INTEGER DEFAULT 100,
+  p_lease_seconds INTEGER DEFAULT 300
+)
+RETURNS TABLE (id UUID, content TEXT, hook TEXT)
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $$
+BEGIN
+  IF p_task NOT IN ('topic', 'hook', 'structure', 'audience', 'reclassify') THEN
+    RAISE EXCEPTION 'Unknown classification task: %', p_task;
+  END IF;
+
+  RETURN QUERY
+  WITH candidates AS (
+    SELECT vpb.id
+    FROM viral_posts_bank vpb
+    WHERE CASE p_task
+        WHEN 'topic' THEN vpb.topic_id IS NULL
+        WHEN 'hook' THEN vpb.hook_type_id IS NULL
+        WHEN 'structure' THEN vpb.structure_id IS NULL
+        WHEN 'audience' THEN vpb.audience_id IS NULL
+        WHEN 'reclassify' THEN vpb.needs_llm_classification
+      END
+      AND vpb.duplicate_of IS NULL
+      AND NOT EXISTS (
+        SELECT 1 FROM viral_post_leases l
+        WHERE l.post_id = vpb.id
+          AND l.task = p_task
+          AND l.expires_at > NOW()
+      )
+    ORDER BY vpb.created_at DESC
+    LIMIT p_limit
+    FOR UPDATE OF vpb SKIP LOCKED
+  ),
+  leased AS (
+    INSERT INTO viral_post_leases (post_id, task, owner, expires_at)
+    SELECT c.id, p_task, p_owner, NOW() + make_interval(secs => p_lease_seconds)
+    FROM candidates c
+    ON CONFLICT (post_id, task) DO UPDATE
+      SET owner = EXCLUDED.owner,
+          expires_at = EXCLUDED.expires_at,
+          claimed_at = NOW()
+      WHERE viral_post_leases.expires_at <= NOW()
+    RETURNING viral_post_leases.post_id
+  )
+  SELECT vpb.id, vpb.content, vpb.hook
+  FROM viral_posts_bank vpb
+  JOIN leased ON leased.post_id = vpb.id;
+END;
+$$;
+
+COMMENT ON COLUMN viral_posts_bank.needs_llm_classification IS 'Labels come from the rule-based fallback (LLM unavailable); classify_posts.py --reclassify redoes them';
+COMMENT ON COLUMN generated_hooks.needs_llm_classification IS 'hook_type_id comes from the rule-based fallback; classify_hooks.py --reclassify redoes it';
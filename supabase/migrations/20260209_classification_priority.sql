@@ -0,0 +1,479 @@
+-- ============================================================================
+-- PRIORITY SCHEDULING OF CLASSIFICATION AND EMBEDDING WORK
+-- claim_posts_for_classification and claim_flagged_posts used to hand out the
+-- newest rows first, so after a large scrape or backfill the posts the studio
+-- needs first (recent, high-engagement, from studio authors) waited behind
+-- thousands of others. Claims now follow a configurable priority score, with:
+--   - fair share: within a claim, authors take turns (round-robin on their
+--     best posts), so one prolific author cannot fill every batch
+--   - starvation protection: up to overdue_share of every batch goes to posts
+--     that have been waiting longer than max_wait_hours, oldest first
+-- ============================================================================
+
+-- ============================================================================
+-- Weights (one row; change it with UPDATE, then SELECT refresh_classification_priority())
+-- ============================================================================
+CREATE TABLE IF NOT EXISTS classification_priority_settings (
+  id BOOLEAN PRIMARY KEY DEFAULT true CHECK (id),
+  recency_per_day DOUBLE PRECISION NOT NULL DEFAULT 1.0,    -- points per day of post date
+  engagement_weight DOUBLE PRECISION NOT NULL DEFAULT 2.0,  -- points per ln(1 + reactions + comments + shares)
+  internal_author_boost DOUBLE PRECISION NOT NULL DEFAULT 7.0,  -- profiles.type = 'internal'
+  active_author_boost DOUBLE PRECISION NOT NULL DEFAULT 14.0,   -- author has production_posts lately
+  active_author_days INTEGER NOT NULL DEFAULT 30,
+  max_wait_hours DOUBLE PRECISION NOT NULL DEFAULT 24.0,
+  overdue_share DOUBLE PRECISION NOT NULL DEFAULT 0.25 CHECK (overdue_share BETWEEN 0 AND 1),
+  fair_share_window INTEGER NOT NULL DEFAULT 4 CHECK (fair_share_window >= 1),  -- candidates per slot
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+INSERT INTO classification_priority_settings (id) VALUES (true) ON CONFLICT (id) DO NOTHING;
+
+ALTER TABLE classification_priority_settings ENABLE ROW LEVEL SECURITY;
+
+-- ============================================================================
+-- Numeric metrics value (scrapers stored numbers, occasionally strings or nulls)
+-- ============================================================================
+CREATE OR REPLACE FUNCTION metric_count(p_metrics JSONB, p_key TEXT)
+RETURNS NUMERIC
+LANGUAGE sql
+IMMUTABLE
+AS $$
+  SELECT CASE
+    WHEN jsonb_typeof(p_metrics -> p_key) = 'number' THEN (p_metrics ->> p_key)::NUMERIC
+    WHEN (p_metrics ->> p_key) ~ '^\d+(\.\d+)?$' THEN (p_metrics ->> p_key)::NUMERIC
+  END;
+$$;
+
+-- ============================================================================
+-- Priority of a post: higher is claimed first
+-- The recency term uses the absolute post date, not its age: every pending
+-- post ages at the same rate, so the order never changes over time and the
+-- score can be stored and indexed instead of recomputed on every claim.
+-- ============================================================================
+CREATE OR REPLACE FUNCTION compute_classification_priority(
+  p_post_date TIMESTAMPTZ,
+  p_metrics JSONB,
+  p_author_id UUID
+)
+RETURNS DOUBLE PRECISION
+LANGUAGE plpgsql
+STABLE
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $$
+DECLARE
+  s classification_priority_settings%ROWTYPE;
+  v_engagement NUMERIC;
+  v_score DOUBLE PRECISION;
+BEGIN
+  -- Without the settings row every score is NULL: claims fall back to overdue + arbitrary order
+  SELECT * INTO s FROM classification_priority_settings LIMIT 1;
+
+  -- Same reading as scripts/snapshot.py engagement_counts(), plus shares
+  v_engagement := COALESCE(NULLIF(metric_count(p_metrics, 'reactions'), 0),
+                           NULLIF(metric_count(p_metrics, 'likes'), 0),
+                           metric_count(p_metrics, 'num_likes'), 0)
+                + COALESCE(metric_count(p_metrics, 'comments'), 0)
+                + COALESCE(metric_count(p_metrics, 'shares'), 0);
+
+  v_score := s.recency_per_day * EXTRACT(EPOCH FROM COALESCE(p_post_date, NOW())) / 86400
+           + s.engagement_weight * ln(1 + GREATEST(v_engagement, 0));
+
+  IF p_author_id IS NOT NULL THEN
+    IF EXISTS (SELECT 1 FROM profiles p WHERE p.id = p_author_id AND p.type = 'internal') THEN
+      v_score := v_score + s.internal_author_boost;
+    END IF;
+    IF EXISTS (
+      SELECT 1 FROM production_posts pp
+      WHERE pp.author_id = p_author_id
+        AND pp.created_at > NOW() - make_interval(days => s.active_author_days)
+    ) THEN
+      v_score := v_score + s.active_author_boost;
+    END IF;
+  END IF;
+
+  RETURN v_score;
+END;
+$$;
+
+ALTER TABLE viral_posts_bank
+ADD COLUMN IF NOT EXISTS classification_priority DOUBLE PRECISION;
+
+CREATE OR REPLACE FUNCTION set_classification_priority()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  NEW.classification_priority := compute_classification_priority(
+    COALESCE(NEW.original_post_date, NEW.created_at), NEW.metrics, NEW.author_id);
+  RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trigger_set_classification_priority ON viral_posts_bank;
+CREATE TRIGGER trigger_set_classification_priority
+  BEFORE INSERT OR UPDATE OF metrics, original_post_date, author_id ON viral_posts_bank
+  FOR EACH ROW
+  EXECUTE FUNCTION set_classification_priority();
+
+-- ============================================================================
+-- Recompute stored priorities (after changing the weights, or nightly so the
+-- author boosts follow the studio). Returns the number of rows updated.
+-- p_pending_only limits it to posts some claim can still hand out: the score
+-- of a fully classified post orders nothing, and every rewritten row gets a
+-- new last_updated_at (update_viral_post_timestamp), so snapshot.py sync
+-- would pull it again.
+-- ============================================================================
+DROP FUNCTION IF EXISTS refresh_classification_priority(UUID);
+
+CREATE OR REPLACE FUNCTION refresh_classification_priority(
+  p_author_id UUID DEFAULT NULL,
+  p_pending_only BOOLEAN DEFAULT false
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $$
+DECLARE
+  v_count INTEGER;
+BEGIN
+  UPDATE viral_posts_bank vpb
+  SET classification_priority = r.priority
+  FROM (
+    SELECT v.id, compute_classification_priority(
+      COALESCE(v.original_post_date, v.created_at), v.metrics, v.author_id) AS priority
+    FROM viral_posts_bank v
+    WHERE (p_author_id IS NULL OR v.author_id = p_author_id)
+      AND (NOT p_pending_only OR (
+        v.duplicate_of IS NULL AND (
+          v.topic_id IS NULL OR v.hook_type_id IS NULL OR v.structure_id IS NULL
+          OR v.audience_id IS NULL OR v.needs_llm_classification
+        )
+        OR v.needs_embedding OR v.needs_hook_classification
+        OR v.needs_topic_classification OR v.needs_audience_classification
+      ))
+  ) r
+  WHERE vpb.id = r.id
+    AND vpb.classification_priority IS DISTINCT FROM r.priority;
+
+  GET DIAGNOSTICS v_count = ROW_COUNT;
+  RETURN v_count;
+END;
+$$;
+
+-- Initial fill of the new column: every row is written once. The scheduling
+-- score is not post content, so last_updated_at is left alone here (otherwise
+-- the next snapshot.py sync would re-download the whole table).
+ALTER TABLE viral_posts_bank DISABLE TRIGGER update_viral_post_timestamp;
+SELECT refresh_classification_priority();
+ALTER TABLE viral_posts_bank ENABLE TRIGGER update_viral_post_timestamp;
+
+-- Nightly: the trigger only recomputes a score when the post's own metrics,
+-- date or author change, so author boosts (internal profile, recent
+-- production_posts) are refreshed here. Only pending posts are rewritten, and
+-- only those whose score moved.
+CREATE EXTENSION IF NOT EXISTS pg_cron;
+
+SELECT cron.unschedule('refresh-classification-priority')
+WHERE EXISTS (SELECT 1 FROM cron.job WHERE jobname = 'refresh-classification-priority');
+
+SELECT cron.schedule(
+  'refresh-classification-priority',
+  '30 2 * * *',  -- every day at 02:30 UTC
+  $$SELECT refresh_classification_priority(NULL, true)$$
+);
+
+-- Pending work per task, by priority and by waiting time. The claims below
+-- repeat each predicate literally so the planner picks these indexes and stops
+-- after LIMIT rows instead of sorting the whole backlog.
+CREATE INDEX IF NOT EXISTS idx_viral_posts_bank_priority_topic
+  ON viral_posts_bank(classification_priority DESC NULLS LAST) WHERE topic_id IS NULL AND duplicate_of IS NULL;
+CREATE INDEX IF NOT EXISTS idx_viral_posts_bank_priority_hook
+  ON viral_posts_bank(classification_priority DESC NULLS LAST) WHERE hook_type_id IS NULL AND duplicate_of IS NULL;
+CREATE INDEX IF NOT EXISTS idx_viral_posts_bank_priority_structure
+  ON viral_posts_bank(classification_priority DESC NULLS LAST) WHERE structure_id IS NULL AND duplicate_of IS NULL;
+CREATE INDEX IF NOT EXISTS idx_viral_posts_bank_priority_audience
+  ON viral_posts_bank(classification_priority DESC NULLS LAST) WHERE audience_id IS NULL AND duplicate_of IS NULL;
+CREATE INDEX IF NOT EXISTS idx_viral_posts_bank_priority_reclassify
+  ON viral_posts_bank(classification_priority DESC NULLS LAST) WHERE needs_llm_classification AND duplicate_of IS NULL;
+CREATE INDEX IF NOT EXISTS idx_viral_posts_bank_waiting_topic
+  ON viral_posts_bank(created_at) WHERE topic_id IS NULL AND duplicate_of IS NULL;
+CREATE INDEX IF NOT EXISTS idx_viral_posts_bank_waiting_hook
+  ON viral_posts_bank(created_at) WHERE hook_type_id IS NULL AND duplicate_of IS NULL;
+CREATE INDEX IF NOT EXISTS idx_viral_posts_bank_waiting_structure
+  ON viral_posts_bank(created_at) WHERE structure_id IS NULL AND duplicate_of IS NULL;
+CREATE INDEX IF NOT EXISTS idx_viral_posts_bank_waiting_audience
+  ON viral_posts_bank(created_at) WHERE audience_id IS NULL AND duplicate_of IS NULL;
+-- 'reclassify' waits on idx_viral_posts_bank_needs_llm_classification (20260208)
+
+-- Same for the worker flags
+CREATE INDEX IF NOT EXISTS idx_viral_posts_bank_priority_needs_embedding
+  ON viral_posts_bank(classification_priority DESC NULLS LAST)
+  WHERE needs_embedding = true AND embedding IS NULL;
+CREATE INDEX IF NOT EXISTS idx_viral_posts_bank_priority_needs_hook
+  ON viral_posts_bank(classification_priority DESC NULLS LAST)
+  WHERE needs_hook_classification = true AND hook_type_id IS NULL AND hook IS NOT NULL AND hook != '';
+CREATE INDEX IF NOT EXISTS idx_viral_posts_bank_priority_needs_topic
+  ON viral_posts_bank(classification_priority DESC NULLS LAST)
+  WHERE needs_topic_classification = true AND topic_id IS NULL AND content IS NOT NULL AND content != '';
+CREATE INDEX IF NOT EXISTS idx_viral_posts_bank_priority_needs_audience
+  ON viral_posts_bank(classification_priority DESC NULLS LAST)
+  WHERE needs_audience_classification = true AND audience_id IS NULL AND content IS NOT NULL AND content != '';
+CREATE INDEX IF NOT EXISTS idx_viral_posts_bank_waiting_needs_embedding
+  ON viral_posts_bank(created_at)
+  WHERE needs_embedding = true AND embedding IS NULL;
+CREATE INDEX IF NOT EXISTS idx_viral_posts_bank_waiting_needs_hook
+  ON viral_posts_bank(created_at)
+  WHERE needs_hook_classification = true AND hook_type_id IS NULL AND hook IS NOT NULL AND hook != '';
+CREATE INDEX IF NOT EXISTS idx_viral_posts_bank_waiting_needs_topic
+  ON viral_posts_bank(created_at)
+  WHERE needs_topic_classification = true AND topic_id IS NULL AND content IS NOT NULL AND content != '';
+CREATE INDEX IF NOT EXISTS idx_viral_posts_bank_waiting_needs_audience
+  ON viral_posts_bank(created_at)
+  WHERE needs_audience_classification = true AND audience_id IS NULL AND content IS NOT NULL AND content != '';
+
+-- ============================================================================
+-- Classification claims by priority
+-- Same as 20260208_llm_reclassification.sql, ordered by the scheduler:
+--   1. overdue: waiting > max_wait_hours, oldest first, at most overdue_share
+--   2. the p_limit * fair_share_window best posts, authors taking turns
+-- Both tiers are read straight from their partial index (ORDER BY ... LIMIT on
+-- the task's literal predicate, run with EXECUTE so each task gets its own
+-- plan), so a claim costs O(p_limit), not O(backlog).
+-- ============================================================================
+CREATE OR REPLACE FUNCTION claim_posts_for_classification(
+  p_task TEXT,
+  p_owner TEXT,
+  p_limit INTEGER DEFAULT 100,
+  p_lease_seconds INTEGER DEFAULT 300
+)
+RETURNS TABLE (id UUID, content TEXT, hook TEXT)
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $$
+DECLARE
+  v_pending TEXT;
+  v_max_wait INTERVAL;
+  v_overdue INTEGER;
+  v_window INTEGER;
+BEGIN
+  -- Literal predicates (the partial index conditions), never built from input
+  v_pending := CASE p_task
+    WHEN 'topic' THEN 'vpb.topic_id IS NULL AND vpb.duplicate_of IS NULL'
+    WHEN 'hook' THEN 'vpb.hook_type_id IS NULL AND vpb.duplicate_of IS NULL'
+    WHEN 'structure' THEN 'vpb.structure_id IS NULL AND vpb.duplicate_of IS NULL'
+    WHEN 'audience' THEN 'vpb.audience_id IS NULL AND vpb.duplicate_of IS NULL'
+    WHEN 'reclassify' THEN 'vpb.needs_llm_classification AND vpb.duplicate_of IS NULL'
+  END;
+  IF v_pending IS NULL THEN
+    RAISE EXCEPTION 'Unknown classification task: %', p_task;
+  END IF;
+
+  SELECT make_interval(secs => s.max_wait_hours * 3600),
+         CEIL(p_limit * s.overdue_share)::INTEGER,
+         p_limit * s.fair_share_window
+  INTO v_max_wait, v_overdue, v_window
+  FROM classification_priority_settings s
+  LIMIT 1;
+
+  RETURN QUERY EXECUTE format($q$
+    WITH overdue AS (
+      SELECT o.id, 0 AS tier, row_number() OVER (ORDER BY o.created_at) AS turn
+      FROM (
+        SELECT vpb.id, vpb.created_at
+        FROM viral_posts_bank vpb
+        WHERE %1$s
+          AND vpb.created_at < NOW() - $3
+          AND NOT EXISTS (
+            SELECT 1 FROM viral_post_leases l
+            WHERE l.post_id = vpb.id AND l.task = $1 AND l.expires_at > NOW()
+          )
+        ORDER BY vpb.created_at
+        LIMIT $4
+      ) o
+    ),
+    best AS (
+      SELECT b.id, 1 AS tier,
+             row_number() OVER (PARTITION BY b.author_id ORDER BY b.classification_priority DESC NULLS LAST) AS turn
+      FROM (
+        SELECT vpb.id, vpb.author_id, vpb.classification_priority
+        FROM viral_posts_bank vpb
+        WHERE %1$s
+          AND NOT EXISTS (
+            SELECT 1 FROM viral_post_leases l
+            WHERE l.post_id = vpb.id AND l.task = $1 AND l.expires_at > NOW()
+          )
+        ORDER BY vpb.classification_priority DESC NULLS LAST
+        LIMIT $5
+      ) b
+    ),
+    schedule AS (
+      SELECT DISTINCT ON (s.id) s.id, s.tier, s.turn
+      FROM (SELECT * FROM overdue UNION ALL SELECT * FROM best) s
+      ORDER BY s.id, s.tier
+    ),
+    candidates AS (
+      SELECT vpb.id
+      FROM viral_posts_bank vpb
+      JOIN schedule ON schedule.id = vpb.id
+      ORDER BY schedule.tier, schedule.turn, vpb.classification_priority DESC NULLS LAST
+      LIMIT $6
+      FOR UPDATE OF vpb SKIP LOCKED
+    ),
+    leased AS (
+      INSERT INTO viral_post_leases (post_id, task, owner, expires_at)
+      SELECT c.id, $1, $2, NOW() + make_interval(secs => $7)
+      FROM candidates c
+      ON CONFLICT (post_id, task) DO UPDATE
+        SET owner = EXCLUDED.owner,
+            expires_at = EXCLUDED.expires_at,
+            claimed_at = NOW()
+        WHERE viral_post_leases.expires_at <= NOW()
+      RETURNING viral_post_leases.post_id
+    )
+    SELECT vpb.id, vpb.content, vpb.hook
+    FROM viral_posts_bank vpb
+    JOIN leased ON leased.post_id = vpb.id
+  $q$, v_pending)
+  USING p_task, p_owner,
+        COALESCE(v_max_wait, INTERVAL '24 hours'),
+        COALESCE(v_overdue, CEIL(p_limit * 0.25)::INTEGER),
+        COALESCE(v_window, p_limit * 4),
+        p_limit, p_lease_seconds;
+END;
+$$;
+
+-- ============================================================================
+-- Flag claims (worker.py, embeddings included) by priority
+-- Same as 20260206_worker_flag_claims.sql, scheduled like the claims above
+-- ============================================================================
+CREATE OR REPLACE FUNCTION claim_flagged_posts(
+  p_flag TEXT,
+  p_owner TEXT,
+  p_limit INTEGER DEFAULT 50,
+  p_lease_seconds INTEGER DEFAULT 300
+)
+RETURNS TABLE (id UUID, content TEXT, hook TEXT)
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $$
+DECLARE
+  v_pending TEXT;
+  v_max_wait INTERVAL;
+  v_overdue INTEGER;
+  v_window INTEGER;
+BEGIN
+  -- Literal predicates (the partial index conditions, plus the Deno embedding
+  -- workers' lock), never built from input
+  v_pending := CASE p_flag
+    WHEN 'needs_embedding' THEN
+      'vpb.needs_embedding = true AND vpb.embedding IS NULL
+       AND (vpb.embedding_locked_at IS NULL OR vpb.embedding_locked_at < NOW() - INTERVAL ''5 minutes'')'
+    WHEN 'needs_hook_classification' THEN
+      'vpb.needs_hook_classification = true AND vpb.hook_type_id IS NULL
+       AND vpb.hook IS NOT NULL AND vpb.hook != '''''
+    WHEN 'needs_topic_classification' THEN
+      'vpb.needs_topic_classification = true AND vpb.topic_id IS NULL
+       AND vpb.content IS NOT NULL AND vpb.content != '''''
+    WHEN 'needs_audience_classification' THEN
+      'vpb.needs_audience_classification = true AND vpb.audience_id IS NULL
+       AND vpb.content IS NOT NULL AND vpb.content != '''''
+  END;
+  IF v_pending IS NULL THEN
+    RAISE EXCEPTION 'Unknown flag: %', p_flag;
+  END IF;
+
+  SELECT make_interval(secs => s.max_wait_hours * 3600),
+         CEIL(p_limit * s.overdue_share)::INTEGER,
+         p_limit * s.fair_share_window
+  INTO v_max_wait, v_overdue, v_window
+  FROM classification_priority_settings s
+  LIMIT 1;
+
+  RETURN QUERY EXECUTE format($q$
+    WITH overdue AS (
+      SELECT o.id, 0 AS tier, row_number() OVER (ORDER BY o.created_at) AS turn
+      FROM (
+        SELECT vpb.id, vpb.created_at
+        FROM viral_posts_bank vpb
+        WHERE %1$s
+          AND vpb.created_at < NOW() - $3
+          AND NOT EXISTS (
+            SELECT 1 FROM viral_post_leases l
+            WHERE l.post_id = vpb.id AND l.task = $1 AND l.expires_at > NOW()
+          )
+        ORDER BY vpb.created_at
+        LIMIT $4
+      ) o
+    ),
+    best AS (
+      SELECT b.id, 1 AS tier,
+             row_number() OVER (PARTITION BY b.author_id ORDER BY b.classification_priority DESC NULLS LAST) AS turn
+      FROM (
+        SELECT vpb.id, vpb.author_id, vpb.classification_priority
+        FROM viral_posts_bank vpb
+        WHERE %1$s
+          AND NOT EXISTS (
+            SELECT 1 FROM viral_post_leases l
+            WHERE l.post_id = vpb.id AND l.task = $1 AND l.expires_at > NOW()
+          )
+        ORDER BY vpb.classification_priority DESC NULLS LAST
+        LIMIT $5
+      ) b
+    ),
+    schedule AS (
+      SELECT DISTINCT ON (s.id) s.id, s.tier, s.turn
+      FROM (SELECT * FROM overdue UNION ALL SELECT * FROM best) s
+      ORDER BY s.id, s.tier
+    ),
+    candidates AS (
+      SELECT vpb.id
+      FROM viral_posts_bank vpb
+      JOIN schedule ON schedule.id = vpb.id
+      ORDER BY schedule.tier, schedule.turn, vpb.classification_priority DESC NULLS LAST
+      LIMIT $6
+      FOR UPDATE OF vpb SKIP LOCKED
+    ),
+    leased AS (
+      INSERT INTO viral_post_leases (post_id, task, owner, expires_at)
+      SELECT c.id, $1, $2, NOW() + make_interval(secs => $7)
+      FROM candidates c
+      ON CONFLICT (post_id, task) DO UPDATE
+        SET owner = EXCLUDED.owner,
+            expires_at = EXCLUDED.expires_at,
+            claimed_at = NOW()
+        WHERE viral_post_leases.expires_at <= NOW()
+      RETURNING viral_post_leases.post_id
+    )
+    SELECT vpb.id, vpb.content, vpb.hook
+    FROM viral_posts_bank vpb
+    JOIN leased ON leased.post_id = vpb.id
+  $q$, v_pending)
+  USING p_flag, p_owner,
+        COALESCE(v_max_wait, INTERVAL '24 hours'),
+        COALESCE(v_overdue, CEIL(p_limit * 0.25)::INTEGER),
+        COALESCE(v_window, p_limit * 4),
+        p_limit, p_lease_seconds;
+
+  -- Keep the Deno embedding workers off the rows we just claimed
+  IF p_flag = 'needs_embedding' THEN
+    UPDATE viral_posts_bank vpb
+    SET embedding_locked_at = NOW()
+    FROM viral_post_leases l
+    WHERE l.post_id = vpb.id
+      AND l.task = p_flag
+      AND l.owner = p_owner
+      AND l.claimed_at = NOW();
+  END IF;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION refresh_classification_priority(UUID) TO service_role;
+
+COMMENT ON TABLE classification_priority_settings IS 'Weights of the classification / embedding scheduler (single row)';
+COMMENT ON COLUMN viral_posts_bank.classification_priority IS 'Scheduling score of the classification and embedding claims (higher first), kept by trigger';
+COMMENT ON FUNCTION compute_classification_priority IS 'Priority of a post: recency + log engagement + studio author boosts, weights from classification_priority_settings';
+COMMENT ON FUNCTION refresh_classification_priority IS 'Recomputes stored priorities (after a weights change); returns the number of rows updated';
@@ -0,0 +1,275 @@
+-- ============================================================================
+-- CLAIM PROJECTION
+-- The claim RPCs returned the full content (up to 5000 chars) of every post,
+-- even for hook classification, which only embeds the hook (or the first line
+-- of the content). p_content_chars trims what they send back:
+--   NULL  full content (default, same as before)
+--   n > 0 left(content, n)
+--   0     no content; hook falls back to the first line of the content
+-- The old 4-argument versions are dropped so PostgREST has a single candidate;
+-- callers that do not pass p_content_chars get the previous behaviour.
+-- ============================================================================
+
+-- ============================================================================
+-- Classification claims with projection
+-- Same as 20260209_classification_priority.sql plus p_content_chars
+-- ============================================================================
+DROP FUNCTION IF EXISTS claim_posts_for_classification(TEXT, TEXT, INTEGER, INTEGER);
+
+CREATE OR REPLACE FUNCTION claim_posts_for_classification(
+  p_task TEXT,
+  p_owner TEXT,
+  p_limit INTEGER DEFAULT 100,
+  p_lease_seconds INTEGER DEFAULT 300,
+  p_content_chars INTEGER DEFAULT NULL
+)
+RETURNS TABLE (id UUID, content TEXT, hook TEXT)
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $$
+DECLARE
+  v_pending TEXT;
+  v_max_wait INTERVAL;
+  v_overdue INTEGER;
+  v_window INTEGER;
+BEGIN
+  -- Literal predicates (the partial index conditions), never built from input
+  v_pending := CASE p_task
+    WHEN 'topic' THEN 'vpb.topic_id IS NULL AND vpb.duplicate_of IS NULL'
+    WHEN 'hook' THEN 'vpb.hook_type_id IS NULL AND vpb.duplicate_of IS NULL'
+    WHEN 'structure' THEN 'vpb.structure_id IS NULL AND vpb.duplicate_of IS NULL'
+    WHEN 'audience' THEN 'vpb.audience_id IS NULL AND vpb.duplicate_of IS NULL'
+    WHEN 'reclassify' THEN 'vpb.needs_llm_classification AND vpb.duplicate_of IS NULL'
+  END;
+  IF v_pending IS NULL THEN
+    RAISE EXCEPTION 'Unknown classification task: %', p_task;
+  END IF;
+
+  SELECT make_interval(secs => s.max_wait_hours * 3600),
+         CEIL(p_limit * s.overdue_share)::INTEGER,
+         p_limit * s.fair_share_window
+  INTO v_max_wait, v_overdue, v_window
+  FROM classification_priority_settings s
+  LIMIT 1;
+
+  RETURN QUERY EXECUTE format($q$
+    WITH overdue AS (
+      SELECT o.id, 0 AS tier, row_number() OVER (ORDER BY o.created_at) AS turn
+      FROM (
+        SELECT vpb.id, vpb.created_at
+        FROM viral_posts_bank vpb
+        WHERE %1$s
+          AND vpb.created_at < NOW() - $3
+          AND NOT EXISTS (
+            SELECT 1 FROM viral_post_leases l
+            WHERE l.post_id = vpb.id AND l.task = $1 AND l.expires_at > NOW()
+          )
+        ORDER BY vpb.created_at
+        LIMIT $4
+      ) o
+    ),
+    best AS (
+      SELECT b.id, 1 AS tier,
+             row_number() OVER (PARTITION BY b.author_id ORDER BY b.classification_priority DESC NULLS LAST) AS turn
+      FROM (
+        SELECT vpb.id, vpb.author_id, vpb.classification_priority
+        FROM viral_posts_bank vpb
+        WHERE %1$s
+          AND NOT EXISTS (
+            SELECT 1 FROM viral_post_leases l
+            WHERE l.post_id = vpb.id AND l.task = $1 AND l.expires_at > NOW()
+          )
+        ORDER BY vpb.classification_priority DESC NULLS LAST
+        LIMIT $5
+      ) b
+    ),
+    schedule AS (
+      SELECT DISTINCT ON (s.id) s.id, s.tier, s.turn
+      FROM (SELECT * FROM overdue UNION ALL SELECT * FROM best) s
+      ORDER BY s.id, s.tier
+    ),
+    candidates AS (
+      SELECT vpb.id
+      FROM viral_posts_bank vpb
+      JOIN schedule ON schedule.id = vpb.id
+      ORDER BY schedule.tier, schedule.turn, vpb.classification_priority DESC NULLS LAST
+      LIMIT $6
+      FOR UPDATE OF vpb SKIP LOCKED
+    ),
+    leased AS (
+      INSERT INTO viral_post_leases (post_id, task, owner, expires_at)
+      SELECT c.id, $1, $2, NOW() + make_interval(secs => $7)
+      FROM candidates c
+      ON CONFLICT (post_id, task) DO UPDATE
+        SET owner = EXCLUDED.owner,
+            expires_at = EXCLUDED.expires_at,
+            claimed_at = NOW()
+        WHERE viral_post_leases.expires_at <= NOW()
+      RETURNING viral_post_leases.post_id
+    )
+    SELECT vpb.id,
+           CASE
+             WHEN $8 IS NULL THEN vpb.content
+             WHEN $8 > 0 THEN left(vpb.content, $8)
+           END,
+           CASE
+             -- Without content the caller cannot fall back to its first line: do it here
+             WHEN $8 = 0 THEN COALESCE(NULLIF(vpb.hook, ''), split_part(vpb.content, E'\n', 1))
+             ELSE vpb.hook
+           END
+    FROM viral_posts_bank vpb
+    JOIN leased ON leased.post_id = vpb.id
+  $q$, v_pending)
+  USING p_task, p_owner,
+        COALESCE(v_max_wait, INTERVAL '24 hours'),
+        COALESCE(v_overdue, CEIL(p_limit * 0.25)::INTEGER),
+        COALESCE(v_window, p_limit * 4),
+        p_limit, p_lease_seconds, p_content_chars;
+END;
+$$;
+
+-- ============================================================================
+-- Flag claims with projection
+-- Same as 20260209_classification_priority.sql plus p_content_chars
+-- ============================================================================
+DROP FUNCTION IF EXISTS claim_flagged_posts(TEXT, TEXT, INTEGER, INTEGER);
+
+CREATE OR REPLACE FUNCTION claim_flagged_posts(
+  p_flag TEXT,
+  p_owner TEXT,
+  p_limit INTEGER DEFAULT 50,
+  p_lease_seconds INTEGER DEFAULT 300,
+  p_content_chars INTEGER DEFAULT NULL
+)
+RETURNS TABLE (id UUID, content TEXT, hook TEXT)
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $$
+DECLARE
+  v_pending TEXT;
+  v_max_wait INTERVAL;
+  v_overdue INTEGER;
+  v_window INTEGER;
+BEGIN
+  -- Literal predicates (the partial index conditions, plus the Deno embedding
+  -- workers' lock), never built from input
+  v_pending := CASE p_flag
+    WHEN 'needs_embedding' THEN
+      'vpb.needs_embedding = true AND vpb.embedding IS NULL
+       AND (vpb.embedding_locked_at IS NULL OR vpb.embedding_locked_at < NOW() - INTERVAL ''5 minutes'')'
+    WHEN 'needs_hook_classification' THEN
+      'vpb.needs_hook_classification = true AND vpb.hook_type_id IS NULL
+       AND vpb.hook IS NOT NULL AND vpb.hook != '''''
+    WHEN 'needs_topic_classification' THEN
+      'vpb.needs_topic_classification = true AND vpb.topic_id IS NULL
+       AND vpb.content IS NOT NULL AND vpb.content != '''''
+    WHEN 'needs_audience_classification' THEN
+      'vpb.needs_audience_classification = true AND vpb.audience_id IS NULL
+       AND vpb.content IS NOT NULL AND vpb.content != '''''
+  END;
+  IF v_pending IS NULL THEN
+    RAISE EXCEPTION 'Unknown flag: %', p_flag;
+  END IF;
+
+  SELECT make_interval(secs => s.max_wait_hours * 3600),
+         CEIL(p_limit * s.overdue_share)::INTEGER,
+         p_limit * s.fair_share_window
+  INTO v_max_wait, v_overdue, v_window
+  FROM classification_priority_settings s
+  LIMIT 1;
+
+  RETURN QUERY EXECUTE format($q$
+    WITH overdue AS (
+      SELECT o.id, 0 AS tier, row_number() OVER (ORDER BY o.created_at) AS turn
+      FROM (
+        SELECT vpb.id, vpb.created_at
+        FROM viral_posts_bank vpb
+        WHERE %1$s
+          AND vpb.created_at < NOW() - $3
+          AND NOT EXISTS (
+            SELECT 1 FROM viral_post_leases l
+            WHERE l.post_id = vpb.id AND l.task = $1 AND l.expires_at > NOW()
+          )
+        ORDER BY vpb.created_at
+        LIMIT $4
+      ) o
+    ),
+    best AS (
+      SELECT b.id, 1 AS tier,
+             row_number() OVER (PARTITION BY b.author_id ORDER BY b.classification_priority DESC NULLS LAST) AS turn
+      FROM (
+        SELECT vpb.id, vpb.author_id, vpb.classification_priority
+        FROM viral_posts_bank vpb
+        WHERE %1$s
+          AND NOT EXISTS (
+            SELECT 1 FROM viral_post_leases l
+            WHERE l.post_id = vpb.id AND l.task = $1 AND l.expires_at > NOW()
+          )
+        ORDER BY vpb.classification_priority DESC NULLS LAST
+        LIMIT $5
+      ) b
+    ),
+    schedule AS (
+      SELECT DISTINCT ON (s.id) s.id, s.tier, s.turn
+      FROM (SELECT * FROM overdue UNION ALL SELECT * FROM best) s
+      ORDER BY s.id, s.tier
+    ),
+    candidates AS (
+      SELECT vpb.id
+      FROM viral_posts_bank vpb
+      JOIN schedule ON schedule.id = vpb.id
+      ORDER BY schedule.tier, schedule.turn, vpb.classification_priority DESC NULLS LAST
+      LIMIT $6
+      FOR UPDATE OF vpb SKIP LOCKED
+    ),
+    leased AS (
+      INSERT INTO viral_post_leases (post_id, task, owner, expires_at)
+      SELECT c.id, $1, $2, NOW() + make_interval(secs => $7)
+      FROM candidates c
+      ON CONFLICT (post_id, task) DO UPDATE
+        SET owner = EXCLUDED.owner,
+            expires_at = EXCLUDED.expires_at,
+            claimed_at = NOW()
+        WHERE viral_post_leases.expires_at <= NOW()
+      RETURNING viral_post_leases.post_id
+    )
+    SELECT vpb.id,
+           CASE
+             WHEN $8 IS NULL THEN vpb.content
+             WHEN $8 > 0 THEN left(vpb.content, $8)
+           END,
+           CASE
+             -- Without content the caller cannot fall back to its first line: do it here
+             WHEN $8 = 0 THEN COALESCE(NULLIF(vpb.hook, ''), split_part(vpb.content, E'\n', 1))
+             ELSE vpb.hook
+           END
+    FROM viral_posts_bank vpb
+    JOIN leased ON leased.post_id = vpb.id
+  $q$, v_pending)
+  USING p_flag, p_owner,
+        COALESCE(v_max_wait, INTERVAL '24 hours'),
+        COALESCE(v_overdue, CEIL(p_limit * 0.25)::INTEGER),
+        COALESCE(v_window, p_limit * 4),
+        p_limit, p_lease_seconds, p_content_chars;
+
+  -- Keep the Deno embedding workers off the rows we just claimed
+  IF p_flag = 'needs_embedding' THEN
+    UPDATE viral_posts_bank vpb
+    SET embedding_locked_at = NOW()
+    FROM viral_post_leases l
+    WHERE l.post_id = vpb.id
+      AND l.task = p_flag
+      AND l.owner = p_owner
+      AND l.claimed_at = NOW();
+  END IF;
+END;
+$$;
+
+-- The Python scripts run with the anon key
+GRANT EXECUTE ON FUNCTION claim_posts_for_classification(TEXT, TEXT, INTEGER, INTEGER, INTEGER) TO anon, service_role;
+GRANT EXECUTE ON FUNCTION claim_flagged_posts(TEXT, TEXT, INTEGER, INTEGER, INTEGER) TO anon, service_role;
+
+COMMENT ON FUNCTION claim_posts_for_classification IS 'Atomically leases up to N unclassified posts for a task by priority; p_content_chars trims the returned content';
+COMMENT ON FUNCTION claim_flagged_posts IS 'Atomically leases up to N posts whose needs_* flag is set, by priority; p_content_chars trims the returned content';